@@ -24,6 +24,10 @@ def register():
     bpy.utils.register_class(DIP_FH_IMPORT)
     bpy.types.TOPBAR_MT_file_import.append(menu_func_import)
     
+    bpy.utils.register_class(ZWO_IMPORTER_OT_RESOLVE_PROXIES)
+    bpy.types.VIEW3D_MT_object.append(menu_func_resolve_proxies)
+    bpy.app.handlers.save_pre.append(PackTextureImages)
+    
     bpy.utils.register_class(ZWO_IMPORTER_OT_EXPORT)
     bpy.types.TOPBAR_MT_file_export.append(menu_func_export)
 
@@ -36,5 +40,9 @@ def unregister():
         bpy.utils.unregister_class(DIP_FH_IMPORT)
         bpy.types.TOPBAR_MT_file_import.remove(menu_func_import)
         
+        bpy.utils.unregister_class(ZWO_IMPORTER_OT_RESOLVE_PROXIES)
+        bpy.types.VIEW3D_MT_object.remove(menu_func_resolve_proxies)
+        bpy.app.handlers.save_pre.remove(PackTextureImages)
+        
         bpy.utils.unregister_class(ZWO_IMPORTER_OT_EXPORT)
         bpy.types.TOPBAR_MT_file_export.remove(menu_func_export)
@@ -11,6 +11,8 @@ from bpy_extras.io_utils import ExportHelper
 from bpy.types import Operator, MeshLoopTriangle
 from bpy.props import CollectionProperty, StringProperty
 from zlib import crc32
+import hashlib
+import numpy as np
 
 from .zwoLib.ReadZWO import read_zwo
 from .zwoLib.WriteZWO import write_zwo
@@ -35,6 +37,8 @@ class ZWO_IMPORTER_OT_EXPORT(Operator, ExportHelper):
     
     overwrite: bpy.props.BoolProperty(name='Overwrite Existing zwo', default=False)
     
+    write_instances: bpy.props.BoolProperty(name='Write Instances', description='Write objects with shared or identical meshes as instances of one mesh', default=False)
+    
     def invoke(self, context, event):
         context.window_manager.fileselect_add(self)
         return {'RUNNING_MODAL'}
@@ -43,6 +47,7 @@ class ZWO_IMPORTER_OT_EXPORT(Operator, ExportHelper):
         layout = self.layout
         layout.prop_search(self, 'collection_name', bpy.data, 'collections')
         layout.prop(self, 'overwrite')
+        layout.prop(self, 'write_instances')
 
     def execute(self, context):
         
@@ -69,7 +74,24 @@ class ZWO_IMPORTER_OT_EXPORT(Operator, ExportHelper):
                 zwo_skeletons.append(entity)
         
         
+        #objects sharing a mesh, or with identical mesh data, are written as instances of the first one
+        #the canonical's geometry is written relative to its local matrix, so only objects with the same one are merged
+        canonical_objects = {}
+        mesh_hashes = {}
+        
         for obj in blender_meshes:
+            if self.write_instances and not self.is_skinned(obj):
+                if obj.data not in mesh_hashes:
+                    mesh_hashes[obj.data] = self.mesh_hash(obj.data)
+                
+                key = (mesh_hashes[obj.data], tuple(value for row in self.local_matrix(obj) for value in row))
+                canonical = canonical_objects.get(key)
+                if canonical:
+                    zwo_meshes.append(self.make_instance(obj, canonical))
+                    continue
+                
+                canonical_objects[key] = obj
+            
             zwomesh = self.make_mesh(obj, zwo_materials)
             zwo_meshes.append(zwomesh)
             
@@ -261,6 +283,65 @@ class ZWO_IMPORTER_OT_EXPORT(Operator, ExportHelper):
         zwo_geometry.TransformerCount = 1
         zwo_geometry.unk = 1000
         
+        world_matrix = obj.matrix_world.copy()
+        local_matrix = self.local_matrix(obj)
+        
+        zwo_geometry.LocalTransformer = self.make_transformer(local_matrix)
+        zwo_geometry.WorldTransformer = self.make_transformer(world_matrix)
+                
+        zwo_geometry.OrientedBoundingBox = self.calculate_obb(obj)
+        
+        zwo_mesh.Geometry = zwo_geometry
+        
+        
+        zwo_mesh.VertexBuffers = [vbuffer] # a mesh can have multiple vertex buffers
+        zwo_mesh.FaceBuffer = fbuffer
+        
+        return zwo_mesh
+    
+    
+    def is_skinned(self, obj):
+        return any(mod.type == 'ARMATURE' for mod in obj.modifiers)
+    
+    
+    def mesh_hash(self, blender_mesh):
+        #hash everything make_mesh writes so identical meshes are only written once
+        mesh_hash = hashlib.blake2b(digest_size=16)
+        
+        co = np.empty(len(blender_mesh.vertices) * 3, dtype=np.float32)
+        blender_mesh.vertices.foreach_get("co", co)
+        mesh_hash.update(co)
+        
+        loop_count = len(blender_mesh.loops)
+        vertex_indices = np.empty(loop_count, dtype=np.int32)
+        blender_mesh.loops.foreach_get("vertex_index", vertex_indices)
+        mesh_hash.update(vertex_indices)
+        
+        normals = np.empty(loop_count * 3, dtype=np.float32)
+        blender_mesh.loops.foreach_get("normal", normals)
+        mesh_hash.update(normals)
+        
+        polygon_count = len(blender_mesh.polygons)
+        loop_starts = np.empty(polygon_count, dtype=np.int32)
+        blender_mesh.polygons.foreach_get("loop_start", loop_starts)
+        mesh_hash.update(loop_starts)
+        
+        material_indices = np.empty(polygon_count, dtype=np.int32)
+        blender_mesh.polygons.foreach_get("material_index", material_indices)
+        mesh_hash.update(material_indices)
+        
+        for uv_layer in blender_mesh.uv_layers:
+            uvs = np.empty(loop_count * 2, dtype=np.float32)
+            uv_layer.data.foreach_get("uv", uvs)
+            mesh_hash.update(uvs)
+        
+        material_names = [mat.name if mat else "" for mat in blender_mesh.materials]
+        mesh_hash.update("|".join(material_names).encode('utf-8'))
+        
+        return mesh_hash.hexdigest()
+    
+    
+    def local_matrix(self, obj):
         #save and reset the object's matrix
         world_matrix = obj.matrix_world.copy()
         obj.matrix_world = Matrix()
@@ -268,35 +349,43 @@ class ZWO_IMPORTER_OT_EXPORT(Operator, ExportHelper):
         
         #restore the object's matrix
         obj.matrix_world = world_matrix
-        
-        local_transformer = zwoTransformer()
-        local_transformer.Position = list(local_matrix.translation)
-        local_transformer.Rotation = list(local_matrix.to_quaternion())
-        local_transformer.Scale = list(local_matrix.to_scale())
-        local_transformer.Matrix = [list(row) for row in local_matrix]
-        
-        zwo_geometry.LocalTransformer = local_transformer
-        
+        return local_matrix
+    
     
-        world_transformer = zwoTransformer()
-        world_transformer.Position = list(world_matrix.translation)
-        world_transformer.Rotation = list(world_matrix.to_quaternion())
-        world_transformer.Scale = list(world_matrix.to_scale())
-        world_transformer.Matrix = [list(row) for row in world_matrix]     
+    def make_instance(self, obj, canonical_obj):
+        zwo_mesh: zwoMesh = zwoMesh()
+        zwo_mesh.Entity = zwoEntity()
+        zwo_mesh.Entity.Name = obj.name
+        zwo_mesh.Entity.Type = 5
+        zwo_mesh.Entity.HeaderType = 6
         
-        zwo_geometry.WorldTransformer = world_transformer
-                
-        zwo_geometry.OrientedBoundingBox = self.calculate_obb(obj)
+        zwo_mesh.Entity3D = zwoEntity3D()
+        zwo_mesh.Entity3D.Name = obj.name
         
-        zwo_mesh.Geometry = zwo_geometry
+        materials = [mat.name for mat in canonical_obj.data.materials if mat]
+        zwo_mesh.Entity3D.MaterialCount = len(materials)
+        zwo_mesh.Entity3D.Materials = materials
         
+        #no geometry, only a reference to the canonical mesh and the instance's world matrix
+        #the canonical's geometry already has its local matrix applied, the instance matrix takes it out again
+        zwo_mesh.Entity3D.flags1 = 0x2
+        zwo_mesh.Entity3D.InstancedObjectName = canonical_obj.name
+        zwo_mesh.Entity3D.WorldTransformer = self.make_transformer(obj.matrix_world @ self.local_matrix(canonical_obj).inverted_safe())
         
-        zwo_mesh.VertexBuffers = [vbuffer] # a mesh can have multiple vertex buffers
-        zwo_mesh.FaceBuffer = fbuffer
+        zwo_mesh.isInstance = True
         
         return zwo_mesh
     
     
+    def make_transformer(self, matrix):
+        transformer = zwoTransformer()
+        transformer.Position = list(matrix.translation)
+        transformer.Rotation = list(matrix.to_quaternion())
+        transformer.Scale = list(matrix.to_scale())
+        transformer.Matrix = [list(row) for row in matrix]
+        return transformer
+    
+    
     def make_material(self, blender_material, old_material= None):
         
         if old_material:
@@ -1,15 +1,23 @@
 import bpy, bmesh
 import os
 from time import time, perf_counter
-from bpy.props import CollectionProperty, StringProperty
+from bpy.props import CollectionProperty, StringProperty, EnumProperty, FloatProperty, BoolProperty, FloatVectorProperty, IntProperty
 from mathutils import Vector, Quaternion, Matrix, Euler
 from bpy_extras.io_utils import ImportHelper
+from bpy.app.handlers import persistent
 from math import radians, tan
-from .zwoLib.ReadZWO import read_zwo
+from .zwoLib.ReadZWO import read_zwo, read_zwo_entity
+from .zwoLib.ParallelZWO import parse_files, read_zwo_parallel
+from .zwoLib.SharedZWO import SharedBuffers
+from .zwoLib.utils.texCache import TextureCache
 from .zwoLib.zwo.zwo import *
 from .zwoLib.utils.texDict import *
 from .zwoLib.zwo.zwoSkeletalAnimation import Entry
+from .zwoLib.zwo.zwoArena import zwoVertexArena
+from .zwoLib.zwo.zwoSpatial import build_spatial_index
 import numpy as np
+from functools import partial
+from collections import namedtuple
 
 class ZWO_IMPORTER_OT_IMPORT(bpy.types.Operator, ImportHelper):
     bl_label = "Import ZWO"
@@ -20,16 +28,77 @@ class ZWO_IMPORTER_OT_IMPORT(bpy.types.Operator, ImportHelper):
     directory: StringProperty(subtype='DIR_PATH', options={'HIDDEN', 'SKIP_SAVE'}) # type: ignore
     filepath: StringProperty(subtype='FILE_PATH') # type: ignore
     textures_path: StringProperty(name= "Textures Path",subtype='FILE_PATH') # type: ignore
+    merge_meshes: EnumProperty(name= "Merge Meshes",
+                               items= [('NONE', "None", "Create one object per mesh"),
+                                       ('MATERIAL', "By Material", "Merge rigid meshes into one object per material"),
+                                       ('CELL', "By Material and Cell", "Merge rigid meshes into one object per material in each grid cell")],
+                               default= 'NONE') # type: ignore
+    merge_cell_size: FloatProperty(name= "Cell Size", default= 50.0, min= 0.001) # type: ignore
+    instance_mode: EnumProperty(name= "Instances",
+                                items= [('LINKED', "Linked Objects", "Create an object sharing the target's mesh for every instance"),
+                                        ('COLLECTION', "Collection Instances", "Instance a prototype collection of the target"),
+                                        ('POINTS', "Point Instances", "Instance the target on points with geometry nodes")],
+                                default= 'LINKED') # type: ignore
+    share_meshes: BoolProperty(name= "Share Identical Meshes", description= "Meshes with identical geometry reuse the same mesh data", default= True) # type: ignore
+    region: EnumProperty(name= "Region",
+                         items= [('NONE', "Everything", "Import every mesh in the file"),
+                                 ('CURSOR', "Around Cursor", "Only import meshes whose bounding box is within the radius of the 3D cursor"),
+                                 ('BOX', "Box", "Only import meshes whose bounding box intersects the box")],
+                         default= 'NONE') # type: ignore
+    region_radius: FloatProperty(name= "Radius", default= 20.0, min= 0.0) # type: ignore
+    region_min: FloatVectorProperty(name= "Box Min", default= (-10.0, -10.0, -10.0), subtype='XYZ') # type: ignore
+    region_max: FloatVectorProperty(name= "Box Max", default= (10.0, 10.0, 10.0), subtype='XYZ') # type: ignore
+    proxies: BoolProperty(name= "Box Proxies", description= "Create bounding box proxies for rigid meshes and resolve their geometry later", default= False) # type: ignore
+    parallel: BoolProperty(name= "Parallel Parsing", description= "Parse the selected files in separate processes before building them", default= True) # type: ignore
+    texture_mode: EnumProperty(name= "Textures",
+                               items= [('PIXELS', "Pixels", "Convert the texture data and upload the pixels directly"),
+                                       ('DDS', "DDS", "Pack each texture as a DDS file for Blender to decode")],
+                               default= 'PIXELS') # type: ignore
+    cache_textures: BoolProperty(name= "Cache Textures", description= "Keep converted textures on disk so later imports of the same dictionaries skip the conversion", default= True) # type: ignore
+    parallel_decode: BoolProperty(name= "Parallel Entity Decode", description= "Decode the entities of each file concurrently", default= False) # type: ignore
+    mip_level: IntProperty(name= "Mip Level", description= "Import textures from this mip level, 0 is full resolution", default= 0, min= 0) # type: ignore
+    min_resolution: IntProperty(name= "Min Resolution", description= "Import the smallest mip level whose larger side is still at least this many pixels, 0 ignores it", default= 0, min= 0) # type: ignore
 
 
     def execute(self, context):
 
         start_time = perf_counter()
+        BoneMapCache.clear()
+        
+        region = None
+        if self.region == 'CURSOR':
+            region = ('SPHERE', tuple(context.scene.cursor.location), self.region_radius)
+        elif self.region == 'BOX':
+            region = ('BOX', tuple(self.region_min), tuple(self.region_max))
 
-        for file in self.files:
+        paths = [os.path.join(self.directory, file.name) for file in self.files]
+        
+        #parsed payloads live in shared memory until every file is built
+        with SharedBuffers() as Shared:
+            Parsed = {}
+            if self.parallel:
+                texture_paths = [self.textures_path] if os.path.isfile(self.textures_path) and not TexRegistry.is_resident(self.textures_path, self.mip_level, self.min_resolution) else []
+                Parsed = ParseFiles(paths + texture_paths, Shared, lazy=region is not None or self.proxies)
+
+            for path in paths:
+                
+                self.filepath = path
+                import_zwo(self.filepath, self.textures_path,
+                           merge_meshes=self.merge_meshes,
+                           merge_cell_size=self.merge_cell_size,
+                           instance_mode=self.instance_mode,
+                           share_meshes=self.share_meshes,
+                           region=region,
+                           proxies=self.proxies,
+                           zwo=Parsed.get(path),
+                           dic=Parsed.get(self.textures_path),
+                           parallel_decode=self.parallel_decode,
+                           texture_mode=self.texture_mode,
+                           cache_textures=self.cache_textures,
+                           mip_level=self.mip_level,
+                           min_resolution=self.min_resolution)
             
-            self.filepath = os.path.join(self.directory, file.name)
-            import_zwo(self.filepath, self.textures_path)
+            Parsed.clear()
         
         elapsed_s = "{:.2f}s".format(perf_counter() - start_time)
         self.report({'INFO'}, "ZWO file imported in " + elapsed_s)
@@ -46,34 +115,55 @@ class ZWO_IMPORTER_OT_DROP(bpy.types.Operator):
     directory: StringProperty(subtype='DIR_PATH', options={'HIDDEN', 'SKIP_SAVE'}) # type: ignore
     filepath: StringProperty(subtype='FILE_PATH') # type: ignore
     textures_path: StringProperty(subtype='FILE_PATH') # type: ignore
+    parallel: BoolProperty(default= True) # type: ignore
 
 
     def execute(self, context):
 
         start_time = perf_counter()
-
-        for file in self.files:
+        BoneMapCache.clear()
+        
+        #parsed payloads live in shared memory until every file is built
+        with SharedBuffers() as Shared:
+            Parsed = {}
+            if self.parallel:
+                #the models and every texture dictionary they pick up are parsed up front
+                paths = []
+                for file in self.files:
+                    path = os.path.join(self.directory, file.name)
+                    paths.append(path)
+                    if path.endswith(".zwo"):
+                        #only the dictionary the import below uses, the .dip wins when both exist
+                        base_name = os.path.splitext(path)[0]
+                        dictionary = next((p for p in (base_name + ".dip", base_name + ".dic") if os.path.exists(p)), None)
+                        if dictionary and not TexRegistry.is_resident(dictionary):
+                            paths.append(dictionary)
+                Parsed = ParseFiles(paths, Shared)
+
+            for file in self.files:
             
-            self.filepath = os.path.join(self.directory, file.name)
+                self.filepath = os.path.join(self.directory, file.name)
             
-            #check if it's a texture dict or a model
-            if self.filepath.endswith(".dic") or self.filepath.endswith(".dip"):
-                import_texture_dic(self.filepath)
+                #check if it's a texture dict or a model
+                if self.filepath.endswith(".dic") or self.filepath.endswith(".dip"):
+                    import_texture_dic(self.filepath, Parsed.get(self.filepath))
             
-            elif self.filepath.endswith(".zwo"):
-                #search for a .dip or .dic with the same name in the same folder
-                base_name = os.path.splitext(file.name)[0]
-                dip_path = os.path.join(self.directory, base_name + ".dip")
-                dic_path = os.path.join(self.directory, base_name + ".dic")
+                elif self.filepath.endswith(".zwo"):
+                    #search for a .dip or .dic with the same name in the same folder
+                    base_name = os.path.splitext(file.name)[0]
+                    dip_path = os.path.join(self.directory, base_name + ".dip")
+                    dic_path = os.path.join(self.directory, base_name + ".dic")
                 
-                if os.path.exists(dip_path):
-                    self.textures_path = dip_path
-                    import_texture_dic(self.textures_path)
-                elif os.path.exists(dic_path):
-                    self.textures_path = dic_path
-                    import_texture_dic(self.textures_path)
-
-                import_zwo(self.filepath, self.textures_path)
+                    if os.path.exists(dip_path):
+                        self.textures_path = dip_path
+                        import_texture_dic(self.textures_path, Parsed.get(self.textures_path))
+                    elif os.path.exists(dic_path):
+                        self.textures_path = dic_path
+                        import_texture_dic(self.textures_path, Parsed.get(self.textures_path))
+
+                    import_zwo(self.filepath, self.textures_path, zwo=Parsed.get(self.filepath), dic=Parsed.get(self.textures_path))
+            
+            Parsed.clear()
         
         elapsed_s = "{:.2f}s".format(perf_counter() - start_time)
         self.report({'INFO'}, "Files imported in " + elapsed_s)
@@ -82,6 +172,40 @@ class ZWO_IMPORTER_OT_DROP(bpy.types.Operator):
     
     
 
+class ZWO_IMPORTER_OT_RESOLVE_PROXIES(bpy.types.Operator):
+    bl_label = "Resolve ZWO Proxies"
+    bl_idname = "object.zwo_resolve_proxies"
+    bl_options = {'REGISTER', 'UNDO'}
+
+
+    selected_only: BoolProperty(name= "Selected Only", default= True) # type: ignore
+    progressive: BoolProperty(name= "In Background", description= "Resolve the proxies a few at a time while Blender stays usable", default= False) # type: ignore
+    batch_size: IntProperty(name= "Batch Size", default= 20, min= 1) # type: ignore
+
+
+    def execute(self, context):
+
+        start_time = perf_counter()
+        
+        objects = context.selected_objects if self.selected_only else bpy.data.objects
+        names = [obj.name for obj in objects if "zwoOffset" in obj]
+        resolver = ProxyResolver()
+        
+        if self.progressive:
+            bpy.app.timers.register(partial(ResolveProxiesTimer, names, resolver, self.batch_size))
+            self.report({'INFO'}, f"Resolving {len(names)} proxies in the background")
+            return {'FINISHED'}
+        
+        for name in names:
+            resolver.resolve(bpy.data.objects[name])
+        
+        elapsed_s = "{:.2f}s".format(perf_counter() - start_time)
+        self.report({'INFO'}, f"{len(names)} proxies resolved in " + elapsed_s)
+
+        return {'FINISHED'}
+
+
+
 class ZWO_FH_IMPORT(bpy.types.FileHandler):
     bl_idname = "ZWO_FH_import"
     bl_label = "File handler for ZWO files"
@@ -123,18 +247,148 @@ class DIP_FH_IMPORT(bpy.types.FileHandler):
     def draw():
         pass
 
-def import_texture_dic(dicPath):
-    dic: dicFile = read_tex_dictionary(dicPath)
+def ParseFiles(paths, shared=None, lazy=False):
+    #a process pool only pays off when there's more than one model to parse, dictionaries alone are cheap to map lazily
+    if len({path for path in paths if path.lower().endswith(".zwo")}) < 2:
+        return {}
+    return parse_files(paths, lazy, shared=shared)
+
+
+def import_texture_dic(dicPath, dic=None, texture_mode='PIXELS', cache_textures=True, mip_level=0, min_resolution=0):
+    return TexRegistry.load(dicPath, dic, texture_mode, cache_textures, mip_level, min_resolution)
+
+
+#the header fields select_mip needs, kept so resident dictionaries don't have to be parsed again
+TextureHeader = namedtuple("TextureHeader", "Name Width Height MipmapsCount")
+
+class TextureRegistry:
+    #remembers which dictionaries were loaded this session and which images came from them,
+    #so the drop, import and zwo texture paths parse each dictionary once and never duplicate its images
+    #only headers and hashes are kept, the texture data itself is dropped once the images exist
+    #images are tracked per mip level, a preview import and a full import of the same dictionary don't share them
+    def __init__(self):
+        self.Dictionaries = {}
+        self.Images = {}
+    
+    def key(self, path):
+        path = os.path.normcase(os.path.abspath(path))
+        stat = os.stat(path)
+        return path, (stat.st_mtime_ns, stat.st_size)
+    
+    def is_resident(self, path, mip_level=0, min_resolution=0):
+        #true when the dictionary at path is unchanged since it was loaded and all its images still exist at the selected mip levels
+        path, stamp = self.key(path)
+        known = self.Dictionaries.get(path)
+        return bool(known and known[0] == stamp and self.resident(known[1], known[2], mip_level, min_resolution) is not None)
+    
+    def load(self, path, dic=None, texture_mode='PIXELS', cache_textures=True, mip_level=0, min_resolution=0):
+        #returns {texture name: image} for the dictionary at path, creating only the images that are missing
+        path, stamp = self.key(path)
+        known = self.Dictionaries.get(path)
+        if known and known[0] == stamp:
+            images = self.resident(known[1], known[2], mip_level, min_resolution)
+            if images is not None:
+                return images
+        
+        #read lazily, only the mip levels that get converted are paged in
+        #a dictionary opened here is unmapped once its images exist so the file isn't kept locked
+        opened = dic is None
+        if opened:
+            dic: dicFile = read_tex_dictionary(path, lazy=True)
+        try:
+            self.Dictionaries[path] = (stamp, dic.Hash, [TextureHeader(texture.Name, texture.Width, texture.Height, texture.MipmapsCount)
+                                                         for texture in dic.Textures])
+        
+            images = {}
+            missing = []
+            mips = []
+            for texture in dic.Textures:
+                mip = select_mip(texture, mip_level, min_resolution)
+                image = self.image(dic.Hash, texture.Name, mip)
+                if image:
+                    images[texture.Name] = image
+                else:
+                    missing.append(texture)
+                    mips.append(mip)
         
-    for texture in dic.Textures:
-        if not bpy.data.images.get(texture.Name):
-            tex_data = dic2dds(texture)
-            tex = bpy.data.images.new(texture.Name, texture.Width, texture.Height)
-            tex.pack(data=bytes(tex_data), data_len= len(tex_data))
-            tex.source = "FILE"
+            for texture, mip, image in zip(missing, mips, TextureImages(missing, texture_mode, cache_textures, mips)):
+                image["zwoDictionaryHash"] = dic.Hash
+                image["zwoMipLevel"] = mip
+                self.Images[(dic.Hash, texture.Name, mip)] = image.name
+                images[texture.Name] = image
+        
+            return images
+        finally:
+            if opened:
+                dic.close()
+    
+    def image(self, dic_hash, name, mip=0):
+        image = bpy.data.images.get(self.Images.get((dic_hash, name, mip), name))
+        
+        #images from earlier imports or sessions are reused by name unless they came from a different dictionary or mip level
+        if image and image.get("zwoDictionaryHash", dic_hash) == dic_hash and image.get("zwoMipLevel", 0) == mip:
+            self.Images[(dic_hash, name, mip)] = image.name
+            return image
+        return None
+    
+    def resident(self, dic_hash, headers, mip_level=0, min_resolution=0):
+        images = {}
+        for header in headers:
+            image = self.image(dic_hash, header.Name, select_mip(header, mip_level, min_resolution))
+            if not image:
+                return None
+            images[header.Name] = image
+        return images
 
-def import_zwo(zwoPath, texturesPath):
-    zwo: zwoFile = read_zwo(zwoPath)
+
+TexRegistry = TextureRegistry()
+
+
+#converted textures persist on disk across imports and sessions
+TexCache = TextureCache()
+
+def TextureImages(textures, texture_mode='PIXELS', cache_textures=True, mips=None):
+    #the conversions run in a thread pool, only creating the images happens here on the main thread
+    cache = TexCache if cache_textures else None
+    if mips is None:
+        mips = [0] * len(textures)
+    converted = convert_textures(textures, texture_mode, cache=cache, mips=mips)
+    return [TextureImage(texture, texture_mode, data, mip) for texture, mip, data in zip(textures, mips, converted)]
+
+
+def TextureImage(texture, texture_mode='PIXELS', data=None, mip=0):
+    if data is None:
+        data = convert_texture(texture, texture_mode, mip=mip)
+    
+    width, height = mip_size(texture, mip)
+    if texture_mode == 'DDS':
+        tex = bpy.data.images.new(texture.Name, width, height)
+        tex.pack(data=data, data_len= len(data))
+        tex.source = "FILE"
+        return tex
+    
+    #the converted pixels go straight into the image, it's packed by PackTextureImages when the file is saved
+    tex = bpy.data.images.new(texture.Name, width, height, alpha=True)
+    tex.pixels.foreach_set(data)
+    return tex
+
+
+@persistent
+def PackTextureImages(*args):
+    #packing a generated image encodes it to PNG, doing it on save keeps that out of every import
+    for image in bpy.data.images:
+        if image.source == 'GENERATED' and "zwoDictionaryHash" in image and not image.packed_file:
+            image.pack()
+
+def import_zwo(zwoPath, texturesPath, *, merge_meshes='NONE', merge_cell_size=50.0, instance_mode='LINKED', share_meshes=True, region=None, proxies=False, zwo=None, dic=None, parallel_decode=False, texture_mode='PIXELS', cache_textures=True,
+               mip_level=0, min_resolution=0):
+    #region and proxy imports parse lazily and only decode the meshes they build
+    #files parsed ahead of time by the process pool are passed in as zwo and dic
+    if zwo is None:
+        if parallel_decode and region is None and not proxies:
+            zwo: zwoFile = read_zwo_parallel(zwoPath)
+        else:
+            zwo: zwoFile = read_zwo(zwoPath, lazy=region is not None or proxies)
     
     zwoName = os.path.basename(zwoPath)
     
@@ -146,6 +400,9 @@ def import_zwo(zwoPath, texturesPath):
     Materials = []
     Textures = []
     Animations = []
+    ObjectAnimations = []
+    ImportedObjects = {}
+    MeshCache = {}
     
     load_from_folder = False
     
@@ -159,120 +416,47 @@ def import_zwo(zwoPath, texturesPath):
             Skeleton = chunk
         elif chunk.Type == zwoTypes.SkeletalAnimation:
             Animations.append(chunk)
+        elif chunk.Type == zwoTypes.Animation:
+            ObjectAnimations.append(chunk)
         elif chunk.Type == zwoTypes.Mesh:
             Models.append(chunk)
         elif chunk.Type == zwoTypes.Material:
             Materials.append(chunk)
+    
+    if region:
+        Models = RegionModels(zwo, Models, region)
+    
+    #proxies stand in for rigid meshes, so only skinned meshes still need their buffers
+    if zwo.Source:
+        zwo.decode_meshes([Model for Model in Models if not proxies or Model.Entity3D.MeshType != 2])
 
     BoneDict = {}
     ReverseBoneDict = {}
     
     
-    def instancedModel(Model):
-        # get the original model from blender
-        obj = bpy.data.objects.get(Model.Entity3D.InstancedObjectName)
-        if obj:
-            # create a new object but use the data from the original
-            new_obj = bpy.data.objects.new(Model.Entity.Name, obj.data)
-            
-            # transform the instance using entity3d matrix
-            new_obj.matrix_world = Matrix(Model.Entity3D.WorldTransformer.Matrix)
-            
-            return new_obj
-        else:
-            print(f"Instance target {Model.Entity3D.InstancedObjectName} not found")
-            return None
-
-
     def RigidModel(Model):
-        mesh = bpy.data.meshes.new(Model.Entity.Name)
-        obj = bpy.data.objects.new(Model.Entity.Name, mesh)
-
-        #assign materials
-        for material in Model.Entity3D.Materials:
-            if bpy.data.materials.get(material):
-                obj.data.materials.append(bpy.data.materials[material])
-
-        bm = bmesh.new()
-        
-        vertex_buffer = Model.VertexBuffers[0].Vertices
-
-        for v in vertex_buffer["position"]:
-            bm.verts.new(v)
-        
-        bm.verts.ensure_lookup_table()
-        
-        for f in Model.FaceBuffer.Faces:
-            try:
-                face = bm.faces.new([bm.verts[i] for i in f['indices']])
-                face.smooth = True
-                bm.faces.ensure_lookup_table()
-                bm.faces.index_update()
-                face.material_index = f['materialIndex']
-            except:
-                pass
-        bm.to_mesh(mesh)
-        bm.free()
-        
-        #loops
-        loops = mesh.loops
-        loop_count = len(loops)
-        loop_vertex_indices = np.empty(loop_count, dtype=np.int32)
-        loops.foreach_get("vertex_index", loop_vertex_indices)
-        
-        if "normal" in vertex_buffer.dtype.names:
-            normals = vertex_buffer["normal"]
-            mesh.normals_split_custom_set_from_vertices(normals)
-        
-        if "uv0" in vertex_buffer.dtype.names:
-            uv_layer = mesh.uv_layers.new(name = "UVMap_0")
-            uvs = vertex_buffer["uv0"].copy()
-            uvs[:,1] = 1.0 - uvs[:,1]
-            loop_uvs = uvs[loop_vertex_indices]
-            uv_layer.data.foreach_set("uv", loop_uvs.flatten())
+        #identical geometry with the same local transform and materials reuses the same mesh
+        key = None
+        if share_meshes and Model.GeometryHash:
+            local_matrix = tuple(tuple(row) for row in Model.Geometry.LocalTransformers[0].Matrix)
+            key = (Model.GeometryHash, local_matrix, tuple(Model.Entity3D.Materials))
             
-        if "uv1" in vertex_buffer.dtype.names:
-            uv_layer = mesh.uv_layers.new(name = "UVMap_1")
-            uvs = vertex_buffer["uv1"].copy()
-            uvs[:,1] = 1 - uvs[:,1]
-            loop_uvs = uvs[loop_vertex_indices]
-            uv_layer.data.foreach_set("uv", loop_uvs.flatten())
+            mesh = MeshCache.get(key)
+            if mesh:
+                obj = bpy.data.objects.new(Model.Entity.Name, mesh)
+                obj.matrix_world = Matrix(Model.Geometry.WorldTransformers[0].Matrix)
+                return obj
         
-        if "uv2" in vertex_buffer.dtype.names:
-            uv_layer = mesh.uv_layers.new(name = "UVMap_2")
-            uvs = vertex_buffer["uv2"].copy()
-            uvs[:,1] = 1 - uvs[:,1]
-            loop_uvs = uvs[loop_vertex_indices]
-            uv_layer.data.foreach_set("uv", loop_uvs.flatten())
-        
-        if "uv3" in vertex_buffer.dtype.names:
-            uv_layer = mesh.uv_layers.new(name = "UVMap_3")
-            uvs = vertex_buffer["uv3"].copy()
-            uvs[:,1] = 1 - uvs[:,1]
-            loop_uvs = uvs[loop_vertex_indices]
-            uv_layer.data.foreach_set("uv", loop_uvs.flatten())
+        mesh = RigidMesh(Model)
+        obj = bpy.data.objects.new(Model.Entity.Name, mesh)
+        obj.matrix_world = Matrix(Model.Geometry.WorldTransformers[0].Matrix)
         
-        if "color0" in vertex_buffer.dtype.names:
-            color_layer = mesh.vertex_colors.new(name = "Color_0")
-            colors = vertex_buffer["color0"] / 255.0
-
-            colors = colors[:, [1, 2, 3, 0]]
-
-            loop_colors = colors[loop_vertex_indices]
-            color_layer.data.foreach_set("color", loop_colors.flatten())
+        #the extra vertex buffers are animation frames
+        if len(Model.VertexBuffers) > 1:
+            VertexAnimation(obj, Model)
         
-        if "color1" in vertex_buffer.dtype.names:
-            color_layer = mesh.vertex_colors.new(name = "Color_1")
-            colors = vertex_buffer["color1"] / 255.0
-            
-            colors = colors[:, [1, 2, 3, 0]]
-            
-            loop_colors = colors[loop_vertex_indices]
-            color_layer.data.foreach_set("color", loop_colors.flatten())
-            
-            
-        obj.data.transform(Matrix(Model.Geometry.LocalTransformers[0].Matrix))
-        obj.matrix_world = Matrix(Model.Geometry.WorldTransformers[0].Matrix)
+        if key:
+            MeshCache[key] = mesh
         
         return obj
         
@@ -296,7 +480,7 @@ def import_zwo(zwoPath, texturesPath):
 
         bm = bmesh.new()
         
-        vertex_buffer = Model.VertexBuffers[0].Vertices
+        vertex_buffer = Model.VertexBuffers[0].to_native()
         for v in vertex_buffer["position"]:
             bm.verts.new(v)
 
@@ -314,15 +498,15 @@ def import_zwo(zwoPath, texturesPath):
         bm.to_mesh(mesh)
         bm.free()
         
-        if "boneIndex0" in vertex_buffer.dtype.names:
-            vertex_count = len(vertex_buffer)
+        if "boneIndex0" in vertex_buffer:
+            vertex_count = len(vertex_buffer["position"])
             weight_slots = 4  # Max 4 bone weights per vertex
 
             # Make sure vertex groups exist
             max_bone_idx = 0
             for slot in range(weight_slots):
                 index_field = f"boneIndex{slot}"
-                if index_field in vertex_buffer.dtype.names:
+                if index_field in vertex_buffer:
                     max_bone_idx = max(max_bone_idx, vertex_buffer[index_field].max())
 
             for i in range(max_bone_idx + 1):
@@ -330,15 +514,14 @@ def import_zwo(zwoPath, texturesPath):
                     obj.vertex_groups.new(name=f"Bone_{i}")
 
             # Assign weights one by one
-            for v_idx, vert in enumerate(vertex_buffer):
-                for slot in range(weight_slots):
-                    index_field = f"boneIndex{slot}"
-                    weight_field = f"boneWeight{slot}"
-                    if index_field in vertex_buffer.dtype.names and weight_field in vertex_buffer.dtype.names:
-                        b_idx = int(vert[index_field])
-                        w = float(vert[weight_field])
-                        if w > 0:
-                            obj.vertex_groups[b_idx].add([v_idx], w, 'REPLACE')
+            for slot in range(weight_slots):
+                index_field = f"boneIndex{slot}"
+                weight_field = f"boneWeight{slot}"
+                if index_field in vertex_buffer and weight_field in vertex_buffer:
+                    bone_indices = vertex_buffer[index_field]
+                    bone_weights = vertex_buffer[weight_field]
+                    for v_idx in np.flatnonzero(bone_weights > 0).tolist():
+                        obj.vertex_groups[int(bone_indices[v_idx])].add([v_idx], float(bone_weights[v_idx]), 'REPLACE')
 
 
         #loops
@@ -347,39 +530,39 @@ def import_zwo(zwoPath, texturesPath):
         loop_vertex_indices = np.empty(loop_count, dtype=np.int32)
         loops.foreach_get("vertex_index", loop_vertex_indices)
         
-        if "normal" in vertex_buffer.dtype.names:
+        if "normal" in vertex_buffer:
             normals = vertex_buffer["normal"]
             mesh.normals_split_custom_set_from_vertices(normals)
         
-        if "uv0" in vertex_buffer.dtype.names:
+        if "uv0" in vertex_buffer:
             uv_layer = mesh.uv_layers.new(name = "UVMap_0")
             uvs = vertex_buffer["uv0"].copy()
             uvs[:,1] = 1.0 - uvs[:,1]
             loop_uvs = uvs[loop_vertex_indices]
             uv_layer.data.foreach_set("uv", loop_uvs.flatten())
             
-        if "uv1" in vertex_buffer.dtype.names:
+        if "uv1" in vertex_buffer:
             uv_layer = mesh.uv_layers.new(name = "UVMap_1")
             uvs = vertex_buffer["uv1"].copy()
             uvs[:,1] = 1 - uvs[:,1]
             loop_uvs = uvs[loop_vertex_indices]
             uv_layer.data.foreach_set("uv", loop_uvs.flatten())
         
-        if "uv2" in vertex_buffer.dtype.names:
+        if "uv2" in vertex_buffer:
             uv_layer = mesh.uv_layers.new(name = "UVMap_2")
             uvs = vertex_buffer["uv2"].copy()
             uvs[:,1] = 1 - uvs[:,1]
             loop_uvs = uvs[loop_vertex_indices]
             uv_layer.data.foreach_set("uv", loop_uvs.flatten())
         
-        if "uv3" in vertex_buffer.dtype.names:
+        if "uv3" in vertex_buffer:
             uv_layer = mesh.uv_layers.new(name = "UVMap_3")
             uvs = vertex_buffer["uv3"].copy()
             uvs[:,1] = 1 - uvs[:,1]
             loop_uvs = uvs[loop_vertex_indices]
             uv_layer.data.foreach_set("uv", loop_uvs.flatten())
         
-        if "color0" in vertex_buffer.dtype.names:
+        if "color0" in vertex_buffer:
             color_layer = mesh.vertex_colors.new(name = "Color_0")
             colors = vertex_buffer["color0"] / 255.0
             
@@ -388,7 +571,7 @@ def import_zwo(zwoPath, texturesPath):
             loop_colors = colors[loop_vertex_indices]
             color_layer.data.foreach_set("color", loop_colors.flatten())
         
-        if "color1" in vertex_buffer.dtype.names:
+        if "color1" in vertex_buffer:
             color_layer = mesh.vertex_colors.new(name = "Color_1")
             colors = vertex_buffer["color1"] / 255.0
             
@@ -457,16 +640,14 @@ def import_zwo(zwoPath, texturesPath):
                 add_bone(bone, parent, i)
 
         bpy.ops.object.mode_set(mode='OBJECT')
+        
+        #keep the zwo bone order so animations can map entries to bones later
+        armature.data["zwoBoneNames"] = [bone.Name for bone in Skeleton.Bones]
     
-    #load textures
+    #load textures, dictionaries already loaded this session reuse their images
+    Images = {}
     if not load_from_folder and texturesPath:
-        dic: dicFile = read_tex_dictionary(texturesPath)
-        
-        for texture in dic.Textures:
-            tex_data = dic2dds(texture)
-            tex = bpy.data.images.new(texture.Name, texture.Width, texture.Height)
-            tex.pack(data=bytes(tex_data), data_len= len(tex_data))
-            tex.source = "FILE"
+        Images = TexRegistry.load(texturesPath, dic, texture_mode, cache_textures, mip_level, min_resolution)
     
 
     for mat in Materials:
@@ -501,7 +682,7 @@ def import_zwo(zwoPath, texturesPath):
             elif os.path.exists(path_tga):
                 texture.image = bpy.data.images.load(path_tga)
         else:
-            texture.image = bpy.data.images.get(mat.TextureName)
+            texture.image = Images.get(mat.TextureName) or bpy.data.images.get(mat.TextureName)
 
         # Vertex color node
         vcol = nodes.new(type="ShaderNodeVertexColor")
@@ -541,48 +722,65 @@ def import_zwo(zwoPath, texturesPath):
 
 
 
+    if proxies:
+        for name, obj in ProxyModels(zwo, Models, zwoPath, zwoCollection):
+            ImportedObjects[name] = obj
+    
+    MergedNames = set()
+    if merge_meshes != 'NONE' and not proxies:
+        #meshes that are animated, vertex animated or used as instance targets keep their own object
+        keep = {Model.Entity3D.InstancedObjectName for Model in Models if Model.isInstance}
+        keep.update(anim.Entity.Name for anim in ObjectAnimations)
+        keep.update(anim.Entity2.Name for anim in ObjectAnimations)
+        
+        MergeModels = [Model for Model in Models if Model.Entity3D.MeshType == 2 and not Model.isInstance
+                       and len(Model.VertexBuffers) == 1 and Model.Entity.Name not in keep]
+        
+        cell_size = merge_cell_size if merge_meshes == 'CELL' else 0
+        for obj in MergedModels(MergeModels, zwoName, cell_size):
+            zwoCollection.objects.link(obj)
+        
+        MergedNames = {Model.Entity.Name for Model in MergeModels}
+    
+    InstanceModels = []
     for Model in Models:
-        # check if it's an instanced mesh
+        if Model.Entity.Name in MergedNames or Model.Entity.Name in ImportedObjects:
+            continue
+        
+        # instances are resolved once every base mesh exists
         if Model.isInstance:
-            obj = instancedModel(Model)
-            zwoCollection.objects.link(obj)
+            InstanceModels.append(Model)
+        
+        obj = None
         if Model.Entity3D.MeshType == 6:
             obj = DeformableModel(Model)
             zwoCollection.objects.link(obj)
         elif Model.Entity3D.MeshType == 2:
             obj = RigidModel(Model)
             zwoCollection.objects.link(obj)
+        
+        if obj:
+            ImportedObjects[Model.Entity.Name] = obj
+    
+    for name, obj in InstancedModels(InstanceModels, ImportedObjects, zwoCollection, instance_mode):
+        ImportedObjects.setdefault(name, obj)
 
     if Animations:
+        AnimSkeleton = None
         if Skeleton:
-            AnimSkeleton = Skeleton
+            AnimSkeleton = armature
         else:
             obj = bpy.context.object
-            if obj.type == "ARMATURE":
+            if obj and obj.type == "ARMATURE":
                 AnimSkeleton = obj
         
         if AnimSkeleton:
+            #the bone table is built once per armature and shared by every animation
+            boneMap = getBoneMap(AnimSkeleton)
+            
             for anim in Animations:
             
-                #create anim data
-                if not AnimSkeleton.animation_data:
-                    AnimSkeleton.animation_data_create()
-
-                #create an action
-                action = bpy.data.actions.new(name = anim.Entity.Name)
-
-                AnimSkeleton.animation_data.action = action
-                if bpy.app.version >= (4, 4, 0):
-        
-                    #check if an action slot exists for this armature
-                    slot = AnimSkeleton.animation_data.action.slots.get(f"OB{AnimSkeleton.name}")
-
-                    if not slot:
-                        print(f"No action slot found for armature {AnimSkeleton.name}, creating a new one.")
-                        slot = AnimSkeleton.animation_data.action.slots.new(id_type='OBJECT', name=AnimSkeleton.name)
-                    
-                    AnimSkeleton.animation_data.action_slot = slot
-                
+                action = createAction(AnimSkeleton, anim.Entity.Name)
                 fcurves = action.fcurves
 
                 #set fps to 30
@@ -593,37 +791,18 @@ def import_zwo(zwoPath, texturesPath):
                 bpy.context.scene.frame_end = anim.FrameCount-1
 
                 
-                for bone, entry in zip(AnimSkeleton.pose.bones, anim.Entries):
-                    #bone info
-                    edit_bone = obj.data.bones[bone.name]
-
-                    if edit_bone.parent:
-                        matrix = edit_bone.parent.matrix_local.inverted() @ edit_bone.matrix_local
-                    else:
-                        matrix = edit_bone.matrix_local
-
-
-                    loc, rot, scale = matrix.decompose()
-                    if not edit_bone.parent:
-                        rot = Quaternion()
+                for index, entry in enumerate(anim.Entries):
+                    if index >= len(boneMap.PoseBones) or boneMap.PoseBones[index] is None:
+                        continue
                     
-                    target = bone
-
-
                     entry: Entry
-                    entryType = entry.EntryTypeFlag
-                    curveIndex = entry.CurveStartIndex
-                    
-                    pos_data_path = f'pose.bones["{bone.name}"].location'
-                    rot_data_path = f'pose.bones["{bone.name}"].rotation_quaternion'
-                    scale_data_path = f'pose.bones["{bone.name}"].scale'
-                    
-                    group_name = bone.name
+                    pos_data_path, rot_data_path, scale_data_path = boneMap.DataPaths[index]
+                    group_name = boneMap.PoseBones[index].name
                     
                     if entry.positionCurves:
                     
                         positions = np.array(list(entry.positionCurves.values()))
-                        positions -= loc
+                        positions -= boneMap.RestLocations[index]
                         
                         posFrames = np.array(list(entry.positionCurves.keys()))
                         flattened = np.stack((posFrames, positions[:,0], positions[:,1], positions[:,2]), axis=1).flatten()
@@ -635,12 +814,633 @@ def import_zwo(zwoPath, texturesPath):
                         rotFrames = np.array(list(entry.rotationCurves.keys()))
                         rotations = np.array(list(entry.rotationCurves.values()))[:, [3,0,1,2]]
 
-                        rotations = np.array([convertRotation(v, rot) for v in rotations])
+                        rotations = convertRotations(rotations, boneMap.RestRotations[index])
                         flattened = np.stack((rotFrames, rotations[:,0], rotations[:,1], rotations[:,2], rotations[:,3]), axis=1).flatten()
                         insertFrames(fcurves, group_name, rot_data_path, len(rotFrames), flattened, valCount=4)
 
-def convertRotation(rotation, bone_rotation):
-    return bone_rotation.rotation_difference(Quaternion(rotation))
+    for anim in ObjectAnimations:
+        #object animations target a mesh of the same file by name
+        obj = ImportedObjects.get(anim.Entity.Name) or ImportedObjects.get(anim.Entity2.Name)
+        if not obj:
+            print(f"Animation target {anim.Entity.Name} not found")
+            continue
+        
+        if anim.FrameCount == 0:
+            continue
+        
+        ObjectAnimation(obj, anim)
+        
+        #make sure the timeline covers the animation
+        bpy.context.scene.frame_start = 0
+        bpy.context.scene.frame_end = max(bpy.context.scene.frame_end, anim.FrameCount - 1)
+
+
+def ObjectAnimation(obj, anim: zwoAnimation):
+    action = createAction(obj, anim.Entity.Name)
+    fcurves = action.fcurves
+    
+    obj.rotation_mode = 'QUATERNION'
+    
+    frames = np.arange(anim.FrameCount, dtype=np.float32)
+    group_name = "Object Transforms"
+    
+    #one keyframe per frame for every track, converted in a single pass
+    positions = np.column_stack((frames, anim.Positions))
+    insertFrames(fcurves, group_name, "location", anim.FrameCount, positions.ravel())
+    
+    #rotations are stored as xyzw
+    rotations = np.column_stack((frames, anim.Rotations[:, [3, 0, 1, 2]]))
+    insertFrames(fcurves, group_name, "rotation_quaternion", anim.FrameCount, rotations.ravel(), valCount=4)
+    
+    scales = np.column_stack((frames, anim.Scales))
+    insertFrames(fcurves, group_name, "scale", anim.FrameCount, scales.ravel())
+
+
+def RigidMesh(Model):
+    #builds the mesh data of a rigid model with its local transform applied
+    mesh = bpy.data.meshes.new(Model.Entity.Name)
+
+    #assign materials
+    for material in Model.Entity3D.Materials:
+        if bpy.data.materials.get(material):
+            mesh.materials.append(bpy.data.materials[material])
+
+    bm = bmesh.new()
+
+    vertex_buffer = Model.VertexBuffers[0].to_native()
+
+    for v in vertex_buffer["position"]:
+        bm.verts.new(v)
+
+    bm.verts.ensure_lookup_table()
+
+    for f in Model.FaceBuffer.Faces:
+        try:
+            face = bm.faces.new([bm.verts[i] for i in f['indices']])
+            face.smooth = True
+            bm.faces.ensure_lookup_table()
+            bm.faces.index_update()
+            face.material_index = f['materialIndex']
+        except:
+            pass
+    bm.to_mesh(mesh)
+    bm.free()
+
+    #loops
+    loops = mesh.loops
+    loop_count = len(loops)
+    loop_vertex_indices = np.empty(loop_count, dtype=np.int32)
+    loops.foreach_get("vertex_index", loop_vertex_indices)
+
+    if "normal" in vertex_buffer:
+        normals = vertex_buffer["normal"]
+        mesh.normals_split_custom_set_from_vertices(normals)
+
+    if "uv0" in vertex_buffer:
+        uv_layer = mesh.uv_layers.new(name = "UVMap_0")
+        uvs = vertex_buffer["uv0"].copy()
+        uvs[:,1] = 1.0 - uvs[:,1]
+        loop_uvs = uvs[loop_vertex_indices]
+        uv_layer.data.foreach_set("uv", loop_uvs.flatten())
+
+    if "uv1" in vertex_buffer:
+        uv_layer = mesh.uv_layers.new(name = "UVMap_1")
+        uvs = vertex_buffer["uv1"].copy()
+        uvs[:,1] = 1 - uvs[:,1]
+        loop_uvs = uvs[loop_vertex_indices]
+        uv_layer.data.foreach_set("uv", loop_uvs.flatten())
+
+    if "uv2" in vertex_buffer:
+        uv_layer = mesh.uv_layers.new(name = "UVMap_2")
+        uvs = vertex_buffer["uv2"].copy()
+        uvs[:,1] = 1 - uvs[:,1]
+        loop_uvs = uvs[loop_vertex_indices]
+        uv_layer.data.foreach_set("uv", loop_uvs.flatten())
+
+    if "uv3" in vertex_buffer:
+        uv_layer = mesh.uv_layers.new(name = "UVMap_3")
+        uvs = vertex_buffer["uv3"].copy()
+        uvs[:,1] = 1 - uvs[:,1]
+        loop_uvs = uvs[loop_vertex_indices]
+        uv_layer.data.foreach_set("uv", loop_uvs.flatten())
+
+    if "color0" in vertex_buffer:
+        color_layer = mesh.vertex_colors.new(name = "Color_0")
+        colors = vertex_buffer["color0"] / 255.0
+
+        colors = colors[:, [1, 2, 3, 0]]
+
+        loop_colors = colors[loop_vertex_indices]
+        color_layer.data.foreach_set("color", loop_colors.flatten())
+
+    if "color1" in vertex_buffer:
+        color_layer = mesh.vertex_colors.new(name = "Color_1")
+        colors = vertex_buffer["color1"] / 255.0
+
+        colors = colors[:, [1, 2, 3, 0]]
+
+        loop_colors = colors[loop_vertex_indices]
+        color_layer.data.foreach_set("color", loop_colors.flatten())
+    
+    mesh.transform(Matrix(Model.Geometry.LocalTransformers[0].Matrix))
+    return mesh
+
+
+def RegionModels(zwo, Models, region):
+    #keeps the meshes whose bounding boxes intersect the region, found without decoding any geometry
+    index = build_spatial_index(zwo)
+    if region[0] == 'SPHERE':
+        hits = index.query_sphere(region[1], region[2])
+    else:
+        hits = index.query_box(region[1], region[2])
+    
+    keep = {Model.Entity.Name for Model in hits}
+    
+    #instances need their target's mesh data even when the target itself is outside the region
+    keep.update(Model.Entity3D.InstancedObjectName for Model in hits if Model.isInstance)
+    
+    return [Model for Model in Models if Model.Entity.Name in keep]
+
+
+def ProxyModels(zwo, Models, zwoPath, zwoCollection):
+    #one box per rigid mesh or instance built from its first oriented bounding box, no geometry is decoded
+    index = build_spatial_index(zwo)
+    targets = {Model.Entity.Name: Model for Model in zwo.Entities
+               if Model.Type == zwoTypes.Mesh and Model.Entity3D.HasGeometry and Model.Entity3D.MeshType == 2}
+    include = {id(Model) for Model in Models if Model.Entity3D.MeshType == 2 or Model.isInstance}
+    
+    proxy_mesh = ProxyMesh()
+    objects = []
+    for Model, transformer_index, center, axes in zip(index.Entities, index.TransformerIndices, index.Centers, index.Axes):
+        if transformer_index != 0 or id(Model) not in include:
+            continue
+        
+        if Model.isInstance:
+            #instances of deformable meshes or meshes from other files are left to InstancedModels
+            source = targets.get(Model.Entity3D.InstancedObjectName)
+            if not source:
+                continue
+            world_matrix = Model.Entity3D.WorldTransformer.Matrix
+        else:
+            source = Model
+            world_matrix = Model.Geometry.WorldTransformers[0].Matrix
+        
+        #the box axes are half extents, which is exactly the scale of a cube spanning -1 to 1
+        matrix = np.identity(4)
+        matrix[:3, :3] = axes.T
+        matrix[:3, 3] = center
+        
+        obj = bpy.data.objects.new(Model.Entity.Name, proxy_mesh)
+        obj.matrix_world = Matrix(matrix.tolist())
+        obj.display_type = 'WIRE'
+        
+        #everything needed to read the mesh again on its own
+        obj["zwoPath"] = zwoPath
+        obj["zwoOffset"] = source.Offset
+        obj["zwoMatrix"] = [value for row in world_matrix for value in row]
+        
+        zwoCollection.objects.link(obj)
+        objects.append((Model.Entity.Name, obj))
+    
+    return objects
+
+
+def ProxyMesh():
+    mesh = bpy.data.meshes.get("zwo_proxy")
+    if not mesh:
+        mesh = bpy.data.meshes.new("zwo_proxy")
+        vertices = [(x, y, z) for x in (-1, 1) for y in (-1, 1) for z in (-1, 1)]
+        faces = [(0, 1, 3, 2), (4, 6, 7, 5), (0, 4, 5, 1), (2, 3, 7, 6), (0, 2, 6, 4), (1, 5, 7, 3)]
+        mesh.from_pydata(vertices, [], faces)
+    return mesh
+
+
+class ProxyResolver:
+    #replaces proxy boxes with their real geometry, files are read once and meshes shared between proxies of the same source
+    def __init__(self):
+        self.Files = {}
+        self.Meshes = {}
+    
+    def resolve(self, obj):
+        path = obj["zwoPath"]
+        offset = obj["zwoOffset"]
+        
+        data = self.Files.get(path)
+        if data is None:
+            with open(path, 'rb') as f:
+                data = f.read()
+            self.Files[path] = data
+        
+        mesh = self.Meshes.get((path, offset))
+        is_new = mesh is None
+        if is_new:
+            Model = read_zwo_entity(data, offset)
+            mesh = RigidMesh(Model)
+            self.Meshes[(path, offset)] = mesh
+        
+        obj.data = mesh
+        obj.matrix_world = Matrix(np.array(obj["zwoMatrix"]).reshape(4, 4).tolist())
+        obj.display_type = 'TEXTURED'
+        
+        #the extra vertex buffers are animation frames
+        if is_new and len(Model.VertexBuffers) > 1:
+            VertexAnimation(obj, Model)
+        
+        del obj["zwoPath"], obj["zwoOffset"], obj["zwoMatrix"]
+
+
+def ResolveProxiesTimer(names, resolver, batch_size):
+    #resolves a batch of proxies per tick so the interface stays responsive
+    batch = names[:batch_size]
+    del names[:batch_size]
+    
+    for name in batch:
+        obj = bpy.data.objects.get(name)
+        if obj and "zwoOffset" in obj:
+            resolver.resolve(obj)
+    
+    return 0.01 if names else None
+
+
+def InstancedModels(InstanceModels, ImportedObjects, zwoCollection, instance_mode='LINKED'):
+    #group the instances by target, targets from this file come first then anything already in the scene
+    targets = {}
+    for Model in InstanceModels:
+        targetName = Model.Entity3D.InstancedObjectName
+        target = ImportedObjects.get(targetName) or bpy.data.objects.get(targetName)
+        if not target or not target.data:
+            print(f"Instance target {targetName} not found")
+            continue
+        targets.setdefault(target, []).append(Model)
+    
+    objects = []
+    for target in [target for target in targets if "zwoOffset" in target]:
+        #targets that are still proxies give their instances proxies of the same mesh, so resolving rebuilds them too
+        for Model in targets.pop(target):
+            obj = InstanceProxy(target, Model)
+            zwoCollection.objects.link(obj)
+            objects.append((Model.Entity.Name, obj))
+    
+    for target, Instances in targets.items():
+        if instance_mode == 'POINTS':
+            obj = PointInstances(target, Instances)
+            zwoCollection.objects.link(obj)
+            continue
+        
+        if instance_mode == 'COLLECTION':
+            #the prototype sits at the origin so the instance matrix replaces the target's own
+            prototype = bpy.data.collections.new(f"{target.name}_instance")
+            prototype.objects.link(bpy.data.objects.new(f"{target.name}_prototype", target.data))
+        
+        for Model in Instances:
+            if instance_mode == 'COLLECTION':
+                obj = bpy.data.objects.new(Model.Entity.Name, None)
+                obj.instance_type = 'COLLECTION'
+                obj.instance_collection = prototype
+            else:
+                # create a new object but use the data from the original
+                obj = bpy.data.objects.new(Model.Entity.Name, target.data)
+            
+            # transform the instance using entity3d matrix
+            obj.matrix_world = Matrix(Model.Entity3D.WorldTransformer.Matrix)
+            zwoCollection.objects.link(obj)
+            objects.append((Model.Entity.Name, obj))
+    
+    return objects
+
+
+def InstanceProxy(target, Model):
+    #the target's box moved from the target's world matrix to the instance's
+    instance_world = Matrix(Model.Entity3D.WorldTransformer.Matrix)
+    target_world = Matrix(np.array(target["zwoMatrix"]).reshape(4, 4).tolist())
+    
+    obj = bpy.data.objects.new(Model.Entity.Name, target.data)
+    obj.matrix_world = instance_world @ target_world.inverted_safe() @ target.matrix_world
+    obj.display_type = 'WIRE'
+    
+    obj["zwoPath"] = target["zwoPath"]
+    obj["zwoOffset"] = target["zwoOffset"]
+    obj["zwoMatrix"] = [value for row in Model.Entity3D.WorldTransformer.Matrix for value in row]
+    return obj
+
+
+def PointInstances(target, Instances):
+    count = len(Instances)
+    locations = np.empty((count, 3), dtype=np.float32)
+    rotations = np.empty((count, 3), dtype=np.float32)
+    scales = np.empty((count, 3), dtype=np.float32)
+    
+    for i, Model in enumerate(Instances):
+        loc, rot, scale = Matrix(Model.Entity3D.WorldTransformer.Matrix).decompose()
+        locations[i] = loc
+        rotations[i] = rot.to_euler()
+        scales[i] = scale
+    
+    #one point per instance, the transforms are stored as point attributes
+    mesh = bpy.data.meshes.new(f"{target.name}_instances")
+    mesh.vertices.add(count)
+    mesh.vertices.foreach_set("co", locations.ravel())
+    
+    rotation_attribute = mesh.attributes.new(name="rotation", type='FLOAT_VECTOR', domain='POINT')
+    rotation_attribute.data.foreach_set("vector", rotations.ravel())
+    scale_attribute = mesh.attributes.new(name="scale", type='FLOAT_VECTOR', domain='POINT')
+    scale_attribute.data.foreach_set("vector", scales.ravel())
+    
+    mesh["zwoInstanceNames"] = [Model.Entity.Name for Model in Instances]
+    
+    obj = bpy.data.objects.new(f"{target.name}_instances", mesh)
+    modifier = obj.modifiers.new("Instances", 'NODES')
+    modifier.node_group = InstanceNodeGroup(target)
+    return obj
+
+
+def InstanceNodeGroup(target):
+    tree = bpy.data.node_groups.new(f"{target.name}_instances", 'GeometryNodeTree')
+    tree.interface.new_socket("Geometry", in_out='INPUT', socket_type='NodeSocketGeometry')
+    tree.interface.new_socket("Geometry", in_out='OUTPUT', socket_type='NodeSocketGeometry')
+    
+    nodes = tree.nodes
+    links = tree.links
+    
+    group_input = nodes.new("NodeGroupInput")
+    group_input.location = (-400, 0)
+    
+    group_output = nodes.new("NodeGroupOutput")
+    group_output.location = (400, 0)
+    
+    # the target's geometry without its object transform
+    object_info = nodes.new("GeometryNodeObjectInfo")
+    object_info.location = (-200, -100)
+    object_info.inputs["Object"].default_value = target
+    
+    rotation = nodes.new("GeometryNodeInputNamedAttribute")
+    rotation.location = (-200, -300)
+    rotation.data_type = 'FLOAT_VECTOR'
+    rotation.inputs["Name"].default_value = "rotation"
+    
+    scale = nodes.new("GeometryNodeInputNamedAttribute")
+    scale.location = (-200, -450)
+    scale.data_type = 'FLOAT_VECTOR'
+    scale.inputs["Name"].default_value = "scale"
+    
+    instance = nodes.new("GeometryNodeInstanceOnPoints")
+    instance.location = (100, 0)
+    
+    links.new(group_input.outputs[0], instance.inputs["Points"])
+    links.new(object_info.outputs["Geometry"], instance.inputs["Instance"])
+    links.new(rotation.outputs["Attribute"], instance.inputs["Rotation"])
+    links.new(scale.outputs["Attribute"], instance.inputs["Scale"])
+    links.new(instance.outputs["Instances"], group_output.inputs[0])
+    
+    return tree
+
+
+def MergedModels(Models, zwoName, cell_size=0):
+    if not Models:
+        return []
+    
+    arena = zwoVertexArena(Models)
+    matrices = arena.world_matrices()
+    positions = arena.transformed_positions(matrices).astype(np.float32)
+    normals = arena.transformed_normals(matrices) if "normal" in arena.Attributes else None
+    faces = arena.global_faces()
+    face_mesh_ids = arena.face_mesh_ids()
+    
+    #map every mesh's local material indices to one table of material names
+    material_names = []
+    material_lookup = {}
+    lookup = []
+    lookup_offsets = np.zeros(len(arena.Meshes), dtype=np.int64)
+    for i, Model in enumerate(arena.Meshes):
+        lookup_offsets[i] = len(lookup)
+        for material in Model.Entity3D.Materials:
+            if material not in material_lookup:
+                material_lookup[material] = len(material_names)
+                material_names.append(material)
+            lookup.append(material_lookup[material])
+    
+    #faces pointing to a missing material go to an extra group with no material
+    material_names.append(None)
+    no_material = len(material_names) - 1
+    lookup.append(no_material)
+    lookup = np.array(lookup, dtype=np.int64)
+    material_counts = np.array([len(Model.Entity3D.Materials) for Model in arena.Meshes], dtype=np.int64)
+    local_indices = arena.MaterialIndices.astype(np.int64)
+    valid_material = local_indices < material_counts[face_mesh_ids]
+    face_materials = np.where(valid_material, lookup[lookup_offsets[face_mesh_ids] + np.where(valid_material, local_indices, 0)], no_material)
+    
+    #drop degenerate faces and faces pointing outside of their mesh
+    vertex_end = (arena.VertexOffsets + arena.VertexCounts)[face_mesh_ids]
+    valid = ((faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 0] != faces[:, 2])
+             & (faces.max(axis=1) < vertex_end))
+    
+    faces = faces[valid]
+    face_mesh_ids = face_mesh_ids[valid]
+    face_materials = face_materials[valid]
+    
+    #group faces by material, and by grid cell of their center when a cell size is given
+    keys = face_materials[:, None]
+    if cell_size > 0:
+        centers = positions[faces].mean(axis=1)
+        cells = np.floor(centers / cell_size).astype(np.int64)
+        keys = np.column_stack((keys, cells))
+    
+    groups, group_ids = np.unique(keys, axis=0, return_inverse=True)
+    group_ids = group_ids.ravel()
+    order = np.argsort(group_ids, kind='stable')
+    group_starts = np.searchsorted(group_ids[order], np.arange(len(groups)))
+    group_ends = np.append(group_starts[1:], len(order))
+    
+    objects = []
+    for group, start, end in zip(groups, group_starts, group_ends):
+        face_indices = order[start:end]
+        material = material_names[group[0]]
+        name = f"{zwoName}_{material or 'NoMaterial'}"
+        if cell_size > 0:
+            name += "_{}_{}_{}".format(*group[1:])
+        
+        obj = MergedModel(name, arena, positions, normals, faces[face_indices], face_mesh_ids[face_indices], material)
+        objects.append(obj)
+    
+    return objects
+
+
+def MergedModel(name, arena, positions, normals, faces, face_mesh_ids, material):
+    #only keep the vertices used by this group
+    used, local_faces = np.unique(faces.ravel(), return_inverse=True)
+    local_faces = local_faces.astype(np.int32)
+    face_count = len(faces)
+    
+    mesh = bpy.data.meshes.new(name)
+    mesh.vertices.add(len(used))
+    mesh.vertices.foreach_set("co", positions[used].ravel())
+    mesh.loops.add(face_count * 3)
+    mesh.polygons.add(face_count)
+    mesh.polygons.foreach_set("loop_start", np.arange(0, face_count * 3, 3, dtype=np.int32))
+    mesh.polygons.foreach_set("vertices", local_faces)
+    mesh.polygons.foreach_set("use_smooth", np.ones(face_count, dtype=bool))
+    mesh.update(calc_edges=True)
+    
+    if material and bpy.data.materials.get(material):
+        mesh.materials.append(bpy.data.materials[material])
+    
+    #keep the source mesh of every face so merged pieces can be split back out
+    #the indices point into the names of only the meshes that went into this group
+    mesh_ids, local_mesh_ids = np.unique(face_mesh_ids, return_inverse=True)
+    mesh_index = mesh.attributes.new(name="zwoMeshIndex", type='INT', domain='FACE')
+    mesh_index.data.foreach_set("value", local_mesh_ids.astype(np.int32))
+    mesh["zwoMeshNames"] = [arena.Names[i] for i in mesh_ids]
+    
+    if normals is not None:
+        mesh.normals_split_custom_set_from_vertices(normals[used])
+    
+    loop_vertex_indices = faces.ravel()
+    
+    for i in range(4):
+        uv_name = f"uv{i}"
+        if uv_name in arena.Attributes:
+            uv_layer = mesh.uv_layers.new(name = f"UVMap_{i}")
+            uvs = arena.Attributes[uv_name][loop_vertex_indices]
+            uvs[:,1] = 1.0 - uvs[:,1]
+            uv_layer.data.foreach_set("uv", uvs.ravel())
+    
+    for i in range(2):
+        color_name = f"color{i}"
+        if color_name in arena.Attributes:
+            color_layer = mesh.vertex_colors.new(name = f"Color_{i}")
+            colors = arena.Attributes[color_name] / 255.0
+            
+            #rearrange colors from ARGB to RGBA
+            colors = colors[:, [1, 2, 3, 0]]
+            color_layer.data.foreach_set("color", colors[loop_vertex_indices].ravel())
+    
+    return bpy.data.objects.new(name, mesh)
+
+
+def VertexAnimation(obj, Model):
+    mesh = obj.data
+    vertex_count = len(mesh.vertices)
+    transformers = Model.Geometry.LocalTransformers
+    
+    obj.shape_key_add(name = "Basis", from_mix = False)
+    
+    frameCount = len(Model.VertexBuffers)
+    keyNames = []
+    for i in range(1, frameCount):
+        positions = Model.VertexBuffers[i].to_native()["position"]
+        if len(positions) != vertex_count:
+            print(f"Vertex buffer {i} of {Model.Entity.Name} doesn't match the base mesh")
+            continue
+        
+        #apply the frame's local transform the same way the base mesh gets it
+        transformer = transformers[i] if i < len(transformers) else transformers[0]
+        matrix = np.array(transformer.Matrix, dtype=np.float32)
+        co = positions @ matrix[:3, :3].T + matrix[:3, 3]
+        
+        key = obj.shape_key_add(name = f"Frame_{i}", from_mix = False)
+        key.data.foreach_set("co", co.astype(np.float32).ravel())
+        keyNames.append((i, key.name))
+    
+    if not keyNames:
+        return
+    
+    #each shape key is fully on at its own frame and off at the neighbouring ones
+    action = createAction(mesh.shape_keys, f"{Model.Entity.Name}_frames", id_type='KEY')
+    for frame, keyName in keyNames:
+        frames = np.array([f for f in (frame - 1, frame, frame + 1) if f < frameCount], dtype=np.float32)
+        values = (frames == frame).astype(np.float32)
+        flattened = np.column_stack((frames, values)).ravel()
+        insertFrames(action.fcurves, "Vertex Animation", f'key_blocks["{keyName}"].value', len(frames), flattened, valCount=1)
+    
+    bpy.context.scene.frame_end = max(bpy.context.scene.frame_end, frameCount - 1)
+
+
+def createAction(obj, name, id_type='OBJECT'):
+    #create anim data
+    if not obj.animation_data:
+        obj.animation_data_create()
+
+    #create an action
+    action = bpy.data.actions.new(name = name)
+
+    obj.animation_data.action = action
+    if bpy.app.version >= (4, 4, 0):
+
+        #check if an action slot exists for this datablock, slot identifiers are prefixed with the id code
+        slot = action.slots.get(f"{obj.id_type[:2]}{obj.name}")
+
+        if not slot:
+            print(f"No action slot found for {obj.name}, creating a new one.")
+            slot = action.slots.new(id_type=id_type, name=obj.name)
+        
+        obj.animation_data.action_slot = slot
+    
+    return action
+
+
+class BoneMap:
+    def __init__(self, armature):
+        self.Armature = armature
+        self.PoseBones = []
+        self.DataPaths = []
+        
+        #armatures created by the importer keep the zwo bone order, otherwise fall back to the blender order
+        boneNames = armature.data.get("zwoBoneNames")
+        if boneNames is None:
+            boneNames = [bone.name for bone in armature.data.bones]
+        
+        boneCount = len(boneNames)
+        self.RestLocations = np.zeros((boneCount, 3), dtype=np.float32)
+        self.RestRotations = np.zeros((boneCount, 4), dtype=np.float32)
+        self.RestRotations[:, 0] = 1.0
+        
+        for i, boneName in enumerate(boneNames):
+            pose_bone = armature.pose.bones.get(boneName)
+            self.PoseBones.append(pose_bone)
+            self.DataPaths.append((f'pose.bones["{boneName}"].location',
+                                   f'pose.bones["{boneName}"].rotation_quaternion',
+                                   f'pose.bones["{boneName}"].scale'))
+            if not pose_bone:
+                continue
+            
+            #rest matrix relative to the parent
+            bone = pose_bone.bone
+            if bone.parent:
+                matrix = bone.parent.matrix_local.inverted() @ bone.matrix_local
+            else:
+                matrix = bone.matrix_local
+            
+            loc, rot, scale = matrix.decompose()
+            self.RestLocations[i] = loc
+            
+            #root bones keep an identity rest rotation
+            if bone.parent:
+                self.RestRotations[i] = rot
+
+
+#cached bone maps, cleared at the start of every import operator run
+BoneMapCache = {}
+
+def getBoneMap(armature):
+    boneMap = BoneMapCache.get(armature.as_pointer())
+    if not boneMap or boneMap.Armature != armature or len(boneMap.PoseBones) != len(armature.pose.bones):
+        boneMap = BoneMapCache[armature.as_pointer()] = BoneMap(armature)
+    return boneMap
+
+
+def quatMultiply(a, b):
+    aw, ax, ay, az = np.moveaxis(a, -1, 0)
+    bw, bx, by, bz = np.moveaxis(b, -1, 0)
+    return np.stack((aw * bw - ax * bx - ay * by - az * bz,
+                     aw * bx + ax * bw + ay * bz - az * by,
+                     aw * by - ax * bz + ay * bw + az * bx,
+                     aw * bz + ax * by - ay * bx + az * bw), axis=-1)
+
+
+def convertRotations(rotations, bone_rotation):
+    #same as bone_rotation.rotation_difference(rotation) for every key at once
+    inverse = bone_rotation * np.array([1, -1, -1, -1], dtype=np.float32)
+    return quatMultiply(inverse, rotations)
 
 
 def insertFrames(fcurves, group_name, data_path, kf_count, flattened_values, valCount=3):
@@ -665,4 +1465,8 @@ def insertFrames(fcurves, group_name, data_path, kf_count, flattened_values, val
 
 def menu_func_import(self, context):
     self.layout.operator(ZWO_IMPORTER_OT_IMPORT.bl_idname,
-                        text='.zwo model Importer')
\ No newline at end of file
+                        text='.zwo model Importer')
+
+
+def menu_func_resolve_proxies(self, context):
+    self.layout.operator(ZWO_IMPORTER_OT_RESOLVE_PROXIES.bl_idname)
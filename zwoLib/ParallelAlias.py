@@ -0,0 +1,16 @@
+#this script is run with runpy.run_path in every worker process before anything from the add-on is unpickled
+#it registers the add-on's package (and its parents) as plain packages, so zwoLib modules can be imported under
+#the add-on's name without running the add-on's __init__, which needs bpy
+#PACKAGE and PACKAGE_PATH are passed in as globals by ParallelZWO
+import sys
+import types
+
+parts = PACKAGE.split(".")
+for i in range(len(parts)):
+    name = ".".join(parts[:i + 1])
+    if name in sys.modules:
+        continue
+
+    module = types.ModuleType(name)
+    module.__path__ = [PACKAGE_PATH] if i == len(parts) - 1 else []
+    sys.modules[name] = module
@@ -0,0 +1,139 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack
+import multiprocessing
+import runpy
+import os
+from .utils.PyBinaryReader.binary_reader import *
+from .ReadZWO import read_zwo
+from .zwo.zwo import *
+from .utils.texDict import read_tex_dictionary
+from .SharedZWO import SharedBuffers
+
+#the add-on's package name, zwoLib modules are pickled under it so both sides see the same classes
+PACKAGE = __name__.rpartition(".zwoLib")[0]
+PACKAGE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ALIAS_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ParallelAlias.py")
+
+
+def create_process_pool(max_workers):
+    #spawn is used because forking Blender is not safe, the workers never import bpy
+    initializer = None
+    initargs = ()
+    if PACKAGE:
+        initializer = runpy.run_path
+        initargs = (ALIAS_SCRIPT, {"PACKAGE": PACKAGE, "PACKAGE_PATH": PACKAGE_PATH})
+
+    context = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(max_workers, context, initializer, initargs)
+
+
+def parse_file(path, lazy=False):
+    #runs in a worker, zwo files come back with their vertex buffers already converted to native arrays
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".zwo":
+        return read_zwo(path, native=not lazy, lazy=lazy)
+    elif ext in (".dic", ".dip"):
+        return read_tex_dictionary(path)
+
+    return None
+
+
+#segments exported by this worker, they stay open until the worker exits
+WorkerBuffers = SharedBuffers()
+
+def parse_file_shared(path, lazy=False):
+    #same as parse_file but the decoded payloads travel through shared memory, only the metadata is pickled
+    return WorkerBuffers.export(parse_file(path, lazy))
+
+
+def parse_files(paths, lazy=False, max_workers=None, shared=None):
+    #parses every file in a pool of processes and returns {path: parsed file}
+    #with a SharedBuffers as shared the payloads come back as views of its segments, the caller releases them
+    paths = list(dict.fromkeys(paths))
+    if not paths:
+        return {}
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    with create_process_pool(min(max_workers, len(paths))) as executor:
+        if shared is None:
+            results = executor.map(parse_file, paths, [lazy] * len(paths))
+            return dict(zip(paths, results))
+        
+        #attach before the pool shuts down, the workers hold the segments open until then
+        results = executor.map(parse_file_shared, paths, [lazy] * len(paths))
+        return {path: shared.attach(result) for path, result in zip(paths, results)}
+
+
+#size prefixed entities decoded in the second phase of read_zwo_parallel
+DeferredEntities = {
+    zwoTypes.Material: zwoMaterial,
+    zwoTypes.Mesh: zwoMesh,
+    zwoTypes.Skeleton: zwoSkeleton,
+}
+
+def decode_entity(EntityType, chunk):
+    #runs in a thread or a worker process, chunk holds exactly one size prefixed entity
+    br = BinaryReader(chunk, Endian.BIG, encoding='cp1252')
+    entity = br.read_struct(DeferredEntities[EntityType])
+
+    if EntityType == zwoTypes.Mesh:
+        for vertex_buffer in entity.VertexBuffers:
+            vertex_buffer.to_native()
+
+    return entity
+
+
+#starting worker processes takes a while, below this many materials and skeletons threads are used for everything
+MinProcessEntities = 64
+
+def read_zwo_parallel(filepath, max_workers=None, process_workers=None):
+    #two phase reader, the entity headers are scanned serially then the bodies are decoded concurrently
+    #meshes are mostly numpy work and go to threads, materials and skeletons are plain python
+    #and go to worker processes when there are enough of them, results keep the file order
+    with open(filepath, 'rb') as f:
+        filebytes = f.read()
+
+    br = BinaryReader(filebytes, Endian.BIG, encoding='cp1252')
+
+    zwo = zwoFile()
+    slots = zwo.scan(br)
+
+    deferred = [slot for slot in slots if isinstance(slot, tuple)]
+    if not deferred:
+        zwo.Entities = slots
+        return zwo
+
+    with ExitStack() as stack:
+        #the pools are shut down even when a submit or a decode fails, so no workers are left behind
+        processes = None
+        if process_workers != 0 and sum(slot[0] != zwoTypes.Mesh for slot in deferred) >= MinProcessEntities:
+            processes = stack.enter_context(create_process_pool(process_workers or os.cpu_count() or 1))
+        threads = stack.enter_context(ThreadPoolExecutor(max_workers))
+        
+        futures = []
+        for slot in slots:
+            if not isinstance(slot, tuple):
+                futures.append((slot, None))
+                continue
+
+            EntityType, offset, size = slot
+            executor = processes if processes and EntityType != zwoTypes.Mesh else threads
+            futures.append((slot, executor.submit(decode_entity, EntityType, filebytes[offset:offset + size])))
+
+        for slot, future in futures:
+            if future is None:
+                zwo.Entities.append(slot)
+                continue
+
+            try:
+                entity = future.result()
+            except Exception:
+                print(f"Error reading {slot[0].name} at {slot[1]}")
+                continue
+
+            entity.Offset = slot[1]
+            zwo.Entities.append(entity)
+
+    return zwo
@@ -1,12 +1,38 @@
 from .utils.PyBinaryReader.binary_reader import *
 from enum import Enum
 from .zwo.zwo import *
+from .zwo.zwoArena import build_arena
 
-def read_zwo(filepath):
+def read_zwo(filepath, native=False, arena=False, lazy=False):
     with open(filepath, 'rb') as f:
         filebytes = f.read()
     
     br = BinaryReader(filebytes, Endian.BIG, encoding='cp1252')
 
-    zwo: zwoFile = br.read_struct(zwoFile)
+    zwo: zwoFile = br.read_struct(zwoFile, None, lazy)
+    
+    #lazy files skip the vertex and face buffers, they're decoded later from the file's bytes
+    if lazy:
+        zwo.Source = filebytes
+        return zwo
+    
+    #pack the vertex and face data of all meshes into shared arrays, this also sets their native arrays
+    if arena:
+        zwo.Arena = build_arena(zwo)
+    
+    #convert every vertex buffer to native arrays up front
+    if native:
+        for entity in zwo.Entities:
+            if entity.Type == zwoTypes.Mesh:
+                for vertex_buffer in entity.VertexBuffers:
+                    vertex_buffer.to_native()
+    
     return zwo
+
+
+def read_zwo_entity(data, offset, cls=zwoMesh):
+    #reads a single size prefixed entity from the file's bytes, offsets come from an earlier read_zwo of the same file
+    size = int.from_bytes(data[offset:offset + 4], 'big')
+    br = BinaryReader(data[offset:offset + size], Endian.BIG, encoding='cp1252')
+    
+    return br.read_struct(cls)
@@ -0,0 +1,146 @@
+from multiprocessing import shared_memory, resource_tracker
+from .utils.PyBinaryReader.binary_reader import BrStruct
+import numpy as np
+import gc
+import os
+
+#payloads smaller than this stay in the pickle, copying them through a segment costs more than it saves
+MinSharedSize = 4096
+Alignment = 16
+
+
+def untrack(segment):
+    #only posix segments are registered with the resource tracker
+    if os.name == "posix":
+        resource_tracker.unregister(f"/{segment.name}", "shared_memory")
+
+
+#SharedPayload stands in for a numpy array or bytes object that was moved into a shared memory segment
+#only this small handle is pickled, the receiving side maps it back to a view of the segment
+class SharedPayload:
+    def __init__(self, segment, offset, size, dtype=None, shape=None):
+        self.Segment = segment
+        self.Offset = offset
+        self.Size = size
+        self.Dtype = dtype
+        self.Shape = shape
+
+
+#SharedBuffers owns the shared memory segments on one side of the transport
+#workers export the payloads of a parsed file into one segment per file, Blender attaches to them as zero-copy views
+#and releases them once the import is done, every view must be dropped by then
+class SharedBuffers:
+    def __init__(self):
+        self.Segments = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+    def export(self, obj):
+        #moves every large array and bytes object reachable from obj into a new segment and replaces it with a handle
+        payloads = {}
+        self.collect(obj, payloads, set())
+        if not payloads:
+            return obj
+
+        offsets = {}
+        total = 0
+        for key, value in payloads.items():
+            offsets[key] = total
+            size = value.nbytes if isinstance(value, np.ndarray) else len(value)
+            total += -(-size // Alignment) * Alignment
+
+        segment = shared_memory.SharedMemory(create=True, size=total)
+        #the segment stays open until the worker exits, on windows it would be freed before the other side attaches otherwise
+        self.Segments[segment.name] = segment
+        #the attaching side owns the segment and unlinks it, the worker stops tracking it so it's never unlinked twice
+        untrack(segment)
+
+        handles = {}
+        for key, value in payloads.items():
+            offset = offsets[key]
+            if isinstance(value, np.ndarray):
+                np.ndarray(value.shape, value.dtype, segment.buf, offset)[...] = value
+                handles[key] = SharedPayload(segment.name, offset, value.nbytes, value.dtype, value.shape)
+            else:
+                segment.buf[offset:offset + len(value)] = value
+                handles[key] = SharedPayload(segment.name, offset, len(value))
+
+        return self.replace(obj, lambda value: handles.get(id(value), value), set())
+
+    def attach(self, obj):
+        #maps every handle reachable from obj back to a view of its segment
+        return self.replace(obj, self.view, set())
+
+    def view(self, value):
+        if not isinstance(value, SharedPayload):
+            return value
+
+        segment = self.Segments.get(value.Segment)
+        if segment is None:
+            segment = shared_memory.SharedMemory(name=value.Segment)
+            self.Segments[value.Segment] = segment
+
+        if value.Dtype is None:
+            return segment.buf[value.Offset:value.Offset + value.Size]
+        return np.ndarray(value.Shape, value.Dtype, segment.buf, value.Offset)
+
+    def release(self):
+        #views that are still referenced keep their segment mapped, they are reported instead of invalidated
+        gc.collect()
+        for name, segment in self.Segments.items():
+            try:
+                segment.close()
+            except BufferError:
+                print(f"Shared segment {name} is still in use")
+            try:
+                segment.unlink()
+            except FileNotFoundError:
+                pass
+        self.Segments.clear()
+
+    def collect(self, value, payloads, seen):
+        if id(value) in seen:
+            return
+        seen.add(id(value))
+
+        if isinstance(value, np.ndarray):
+            if value.nbytes >= MinSharedSize and value.dtype != object:
+                payloads[id(value)] = value
+        elif isinstance(value, bytes):
+            if len(value) >= MinSharedSize:
+                payloads[id(value)] = value
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                self.collect(item, payloads, seen)
+        elif isinstance(value, dict):
+            for item in value.values():
+                self.collect(item, payloads, seen)
+        elif isinstance(value, BrStruct):
+            for item in vars(value).values():
+                self.collect(item, payloads, seen)
+
+    def replace(self, value, function, seen):
+        #walks the same structure as collect, lists, dicts and structs are changed in place and tuples rebuilt
+        if isinstance(value, (np.ndarray, bytes, SharedPayload)):
+            return function(value)
+
+        if id(value) in seen:
+            return value
+        seen.add(id(value))
+
+        if isinstance(value, list):
+            value[:] = [self.replace(item, function, seen) for item in value]
+        elif isinstance(value, tuple):
+            return tuple(self.replace(item, function, seen) for item in value)
+        elif isinstance(value, dict):
+            for key, item in value.items():
+                value[key] = self.replace(item, function, seen)
+        elif isinstance(value, BrStruct):
+            for key, item in list(vars(value).items()):
+                setattr(value, key, self.replace(item, function, seen))
+
+        return value
@@ -0,0 +1,153 @@
+import numpy as np
+
+#vectorized conversion between the dic pixel formats and RGBA
+#pixels are little endian words laid out like the masks in texDict.BitMasks:
+#0x15 R8G8B8A8 is an ARGB word (BGRA bytes), 0x17 R5G6B5 and 0x19 R5G5B5A1 are 16 bit words
+#formats are keyed by their TextureFormats value so this module doesn't depend on texDict
+
+R8G8B8A8 = 0x15
+R5G6B5 = 0x17
+R5G5B5A1 = 0x19
+
+#bits per pixel
+PixelBits = {
+    R8G8B8A8: 32,
+    R5G6B5: 16,
+    R5G5B5A1: 16,
+}
+
+
+def format_value(format):
+    return getattr(format, "value", format)
+
+
+def expand_bits(values, bits):
+    #replicates the high bits into the low ones so the full range maps to 0-255
+    values = values.astype(np.uint16)
+    return ((values << (8 - bits)) | (values >> (2 * bits - 8))).astype(np.uint8)
+
+
+def decode_pixels(data, width, height, format, alpha=True):
+    #returns a (height, width, 4) uint8 RGBA array, alpha is opaque when the texture has no alpha
+    format = format_value(format)
+    count = width * height
+    rgba = np.empty((count, 4), dtype=np.uint8)
+
+    if format == R8G8B8A8:
+        bgra = np.frombuffer(data, dtype=np.uint8, count=count * 4).reshape(count, 4)
+        rgba[:, 0] = bgra[:, 2]
+        rgba[:, 1] = bgra[:, 1]
+        rgba[:, 2] = bgra[:, 0]
+        rgba[:, 3] = bgra[:, 3] if alpha else 255
+
+    elif format == R5G6B5:
+        words = np.frombuffer(data, dtype="<u2", count=count)
+        rgba[:, 0] = expand_bits(words >> 11, 5)
+        rgba[:, 1] = expand_bits((words >> 5) & 0x3f, 6)
+        rgba[:, 2] = expand_bits(words & 0x1f, 5)
+        rgba[:, 3] = 255
+
+    elif format == R5G5B5A1:
+        words = np.frombuffer(data, dtype="<u2", count=count)
+        rgba[:, 0] = expand_bits((words >> 10) & 0x1f, 5)
+        rgba[:, 1] = expand_bits((words >> 5) & 0x1f, 5)
+        rgba[:, 2] = expand_bits(words & 0x1f, 5)
+        rgba[:, 3] = (words >> 15) * 255 if alpha else 255
+
+    else:
+        raise ValueError(f"Unsupported texture format {format}")
+
+    return rgba.reshape(height, width, 4)
+
+
+def decode_pixels_float(data, width, height, format, alpha=True):
+    #same as decode_pixels but as float32 in the 0-1 range
+    return decode_pixels(data, width, height, format, alpha).astype(np.float32) / 255.0
+
+
+def quantize(channel, bits):
+    #rounds 0-255 values to the nearest level of a smaller channel
+    levels = (1 << bits) - 1
+    return ((channel.astype(np.uint32) * levels + 127) // 255).astype(np.uint16)
+
+
+def encode_pixels(rgba, format):
+    #packs an RGBA array (uint8 or 0-1 floats) with a last axis of 4 into the format's pixel bytes
+    format = format_value(format)
+    rgba = np.asarray(rgba)
+    if rgba.dtype.kind == 'f':
+        rgba = np.clip(np.rint(rgba * 255.0), 0, 255)
+    rgba = rgba.reshape(-1, 4).astype(np.uint8)
+
+    if format == R8G8B8A8:
+        return rgba[:, [2, 1, 0, 3]].tobytes()
+
+    elif format == R5G6B5:
+        words = (quantize(rgba[:, 0], 5) << 11) | (quantize(rgba[:, 1], 6) << 5) | quantize(rgba[:, 2], 5)
+
+    elif format == R5G5B5A1:
+        words = ((rgba[:, 3] >= 128).astype(np.uint16) << 15) | (quantize(rgba[:, 0], 5) << 10) \
+                | (quantize(rgba[:, 1], 5) << 5) | quantize(rgba[:, 2], 5)
+
+    else:
+        raise ValueError(f"Unsupported texture format {format}")
+
+    return words.astype("<u2").tobytes()
+
+
+def srgb_to_linear(rgb):
+    return np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+
+
+def linear_to_srgb(rgb):
+    rgb = np.clip(rgb, 0.0, 1.0)
+    return np.where(rgb <= 0.0031308, rgb * 12.92, 1.055 * rgb ** (1 / 2.4) - 0.055)
+
+
+#8 tap kaiser windowed sinc for halving, the taps sit at -3.5 to 3.5 input pixels from the output pixel's center
+KaiserTaps = np.kaiser(8, 4.0) * np.sinc(np.arange(-3.5, 4.0) / 2)
+KaiserTaps = (KaiserTaps / KaiserTaps.sum()).astype(np.float32)
+
+
+def halve_axis(image, axis, filter="BOX"):
+    #halves one axis of a float image, axes of size 1 are left alone and odd sizes lose their last pixel
+    size = image.shape[axis]
+    if size == 1:
+        return image
+    half = size // 2
+    image = np.moveaxis(image, axis, 0)
+
+    if filter == "KAISER":
+        padded = np.pad(image[:half * 2], [(3, 3)] + [(0, 0)] * (image.ndim - 1), mode="edge")
+        result = sum(tap * padded[k:k + half * 2:2] for k, tap in enumerate(KaiserTaps))
+    else:
+        result = (image[0:half * 2:2] + image[1:half * 2:2]) * 0.5
+
+    return np.moveaxis(result, 0, axis)
+
+
+def build_mip_chain(rgba, format, alpha=True, filter="BOX", gamma=True):
+    #mip chain of a (height, width, 4) uint8 RGBA image down to 1x1, as the encoded pixel bytes of every level below it
+    #the image itself isn't included, the caller keeps its original bytes as level 0
+    #levels are filtered from the previous float level so the error doesn't build up through quantization
+    #gamma filters the colour in linear space, alpha weights the colour by alpha so transparent pixels don't bleed
+    #and encode_pixels thresholds the averaged alpha again for R5G5B5A1
+    image = np.asarray(rgba).astype(np.float32) / 255.0
+    if gamma:
+        image[..., :3] = srgb_to_linear(image[..., :3])
+    if alpha:
+        image[..., :3] *= image[..., 3:]
+
+    chain = []
+    while image.shape[0] > 1 or image.shape[1] > 1:
+        image = halve_axis(halve_axis(image, 0, filter), 1, filter)
+
+        level = np.clip(image, 0.0, 1.0)
+        if alpha:
+            coverage = level[..., 3:]
+            level[..., :3] = np.where(coverage > 0, level[..., :3] / np.maximum(coverage, 1e-6), 0.0)
+        if gamma:
+            level[..., :3] = linear_to_srgb(level[..., :3])
+        chain.append(encode_pixels(level, format))
+
+    return chain
@@ -0,0 +1,103 @@
+import numpy as np
+import hashlib
+import tempfile
+import threading
+import os
+
+#TextureCache keeps converted textures on disk between imports
+#entries are keyed by the content hash of their dictionary, the texture name and the conversion mode,
+#so an edited dictionary never hits stale entries. Reads refresh an entry's modification time and the
+#least recently used entries are removed once the cache grows past MaxSize
+#Version is part of every key so entries written in an older layout are never read back
+class TextureCache:
+    Version = 2
+
+    def __init__(self, folder=None, max_size=1024 * 1024 * 1024):
+        self.Folder = folder or os.path.join(tempfile.gettempdir(), "zwoBlender", "textures")
+        self.MaxSize = max_size
+        self.Size = None
+        self.Lock = threading.Lock()
+
+    def key(self, dic_hash, name, mode, mip=0):
+        return hashlib.blake2b(f"{self.Version}/{dic_hash}/{name}/{mode}/{mip}".encode("utf-8"), digest_size=16).hexdigest()
+
+    def path(self, key, mode):
+        #pixels are stored as flat float RGBA arrays, DDS entries as the file's bytes
+        return os.path.join(self.Folder, key + (".dds" if mode == "DDS" else ".npy"))
+
+    def get(self, key, mode):
+        path = self.path(key, mode)
+        try:
+            if mode == "DDS":
+                with open(path, 'rb') as f:
+                    data = f.read()
+            else:
+                data = np.load(path)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+
+        return data
+
+    def put(self, key, mode, data):
+        os.makedirs(self.Folder, exist_ok=True)
+        path = self.path(key, mode)
+
+        #written to a temporary file first so other threads and sessions never read half an entry
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                if mode == "DDS":
+                    f.write(data)
+                else:
+                    np.save(f, data)
+            
+            #an entry written again by another thread or session replaces the old file, only the difference is added
+            with self.Lock:
+                replaced = os.path.getsize(path) if os.path.exists(path) else 0
+                os.replace(temp_path, path)
+        except OSError:
+            return
+
+        with self.Lock:
+            if self.Size is None:
+                self.Size = self.folder_size()
+            else:
+                self.Size += os.path.getsize(path) - replaced
+
+            if self.Size > self.MaxSize:
+                self.evict()
+
+    def entries(self):
+        entries = []
+        if not os.path.isdir(self.Folder):
+            return entries
+        
+        for entry in os.scandir(self.Folder):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def folder_size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        #removes the least recently used entries until the cache is back to three quarters of its limit
+        for _, size, path in sorted(self.entries()):
+            if self.Size <= self.MaxSize * 0.75:
+                break
+            try:
+                os.remove(path)
+                self.Size -= size
+            except OSError:
+                pass
+
+    def clear(self):
+        with self.Lock:
+            for _, _, path in self.entries():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self.Size = 0
@@ -1,35 +1,101 @@
 from .PyBinaryReader.binary_reader import *
 from .dds import DDS, DDS_Header, DDS_PixelFormat
 from .brDDS import BrDDS
+from .pixels import decode_pixels, decode_pixels_float, encode_pixels, build_mip_chain
+import numpy as np
 from enum import Enum
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import hashlib
+import struct
+import mmap
 import sys
 import os
 
-def read_tex_dictionary(file_path: str):
+def read_tex_dictionary(file_path: str, lazy=False):
+    #lazy dictionaries only read the texture headers, the mip levels are slices of a memory map of the file
+    #and are only paged in when they're used
     #check file extension
     ext = file_path.split(".")[-1]
-    if ext == "dic":
+    if ext not in ("dic", "dip"):
+        print("Unknown type")
+        return None
+    
+    if lazy:
         with open(file_path, 'rb') as f:
-            br = BinaryReader(f.read(), Endian.BIG, "cp932")
-            dic = br.read_struct(dicFile)
-            return dic
+            source = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        data = memoryview(source)
+        dic = dicFile() if ext == "dic" else dipFile()
+        dic.scan(data)
+        dic.Source = source
         
-    elif ext == "dip":
+        #the content hash would page in the whole file, it's computed the first time it's used
+        for texture in dic.Textures:
+            texture.Dictionary = dic
+        return dic
+    
+    elif ext == "dic":
         with open(file_path, 'rb') as f:
-            br = BinaryReader(f.read(), Endian.LITTLE, "cp932")
-            dip = br.read_struct(dipFile)
-            return dip
+            data = f.read()
+            br = BinaryReader(data, Endian.BIG, "cp932")
+            dic = br.read_struct(dicFile)
         
     else:
-        print("Unknown type")
-        return None
+        with open(file_path, 'rb') as f:
+            data = f.read()
+            br = BinaryReader(data, Endian.LITTLE, "cp932")
+            dic = br.read_struct(dipFile)
+    
+    #the content hash keys converted textures in the texture cache
+    dic.Hash = hashlib.blake2b(data, digest_size=16).hexdigest()
+    for texture in dic.Textures:
+        texture.DictionaryHash = dic.Hash
+    
+    return dic
 
     
 
-class dicFile(BrStruct):
+#shared by dicFile and dipFile, Source is the memory map of a lazily read dictionary
+class texDictionary(BrStruct):
     def __init__(self):
         self.TexturesCount = 0
         self.Textures = []
+        self.Hash = None
+        self.Source = None
+        self.Endian = Endian.BIG
+
+    @property
+    def Hash(self):
+        if self._Hash is None and self.Source is not None:
+            self._Hash = hashlib.blake2b(self.Source, digest_size=16).hexdigest()
+        return self._Hash
+    
+    @Hash.setter
+    def Hash(self, value):
+        self._Hash = value
+
+    def close(self):
+        #unmaps a lazily read dictionary, its textures can't reach their mip levels afterwards
+        #a hash that was already computed is kept on the textures
+        if self.Source is None:
+            return
+        for texture in self.Textures:
+            texture.DictionaryHash = self._Hash
+            texture.Dictionary = None
+            texture.Source = None
+            texture.Mipmaps = []
+        try:
+            self.Source.close()
+        except BufferError:
+            print("Dictionary mip levels are still in use")
+        self.Source = None
+
+
+class dicFile(texDictionary):
+    def __init__(self):
+        super().__init__()
+        #some .dic files are little endian, the one that was read is kept for writing patched textures
+        self.Endian = Endian.BIG
     
     def __br_read__(self, br: BinaryReader):
         self.TexturesCount = br.read_uint32()
@@ -37,11 +103,27 @@ class dicFile(BrStruct):
         if self.TexturesCount > 1000000:
             print("Invalid dic file")
             br.set_endian(Endian.LITTLE)
+            self.Endian = Endian.LITTLE
             br.seek(0)
             self.TexturesCount = br.read_uint32()
             print(self.TexturesCount)
 
         self.Textures = br.read_struct(dicTexture, self.TexturesCount)
+    
+    def scan(self, data):
+        #lazy counterpart of __br_read__ for a memoryview of the whole file
+        self.Endian = Endian.BIG
+        self.TexturesCount = struct.unpack_from(">I", data, 0)[0]
+        if self.TexturesCount > 1000000:
+            self.Endian = Endian.LITTLE
+            self.TexturesCount = struct.unpack_from("<I", data, 0)[0]
+        
+        offset = 4
+        self.Textures = []
+        for i in range(self.TexturesCount):
+            texture = dicTexture()
+            offset = texture.scan(data, offset, self.Endian)
+            self.Textures.append(texture)
 
     def __br_write__(self, br: BinaryReader):
         br.write_uint32(self.TexturesCount)
@@ -59,6 +141,52 @@ class dicTexture(BrStruct):
         self.MipmapsCount = 0
         self.Mipmaps = []
         self.Data = None
+        self.DictionaryHash = None
+        #the dictionary of a lazily read texture, its hash is taken from there when it's needed
+        self.Dictionary = None
+        #set for lazily read textures, Source is a memoryview of the file and MipmapRanges the (offset, size) of each level
+        self.Source = None
+        self.MipmapRanges = []
+        self.RecordRange = None
+    
+    @property
+    def DictionaryHash(self):
+        if self._DictionaryHash is None and self.Dictionary is not None:
+            return self.Dictionary.Hash
+        return self._DictionaryHash
+    
+    @DictionaryHash.setter
+    def DictionaryHash(self, value):
+        self._DictionaryHash = value
+    
+    #lazily read textures only turn their mip levels into slices of Source when they're accessed
+    @property
+    def Mipmaps(self):
+        if self._Mipmaps is None:
+            self._Mipmaps = [self.get_mipmap(i) for i in range(len(self.MipmapRanges))]
+        return self._Mipmaps
+    
+    @Mipmaps.setter
+    def Mipmaps(self, value):
+        self._Mipmaps = value
+    
+    @property
+    def Data(self):
+        if self._Data is None and self.Source is not None:
+            return self.get_mipmap(0)
+        return self._Data
+    
+    @Data.setter
+    def Data(self, value):
+        self._Data = value
+    
+    def get_mipmap(self, mip):
+        #a single level without materializing the others
+        if self._Mipmaps is not None or self.Source is None:
+            return self.Mipmaps[mip]
+        
+        offset, size = self.MipmapRanges[mip]
+        return self.Source[offset:offset + size]
     
     def __br_read__(self, br: BinaryReader):
         br.seek(4, 1)
@@ -76,6 +204,31 @@ class dicTexture(BrStruct):
         
         self.Data = self.Mipmaps[0]
     
+    def scan(self, data, offset, endian):
+        #lazy counterpart of __br_read__, reads the header at offset and returns where the next texture starts
+        start = offset
+        order = ">" if endian == Endian.BIG else "<"
+        NameLength = struct.unpack_from(order + "I", data, offset + 4)[0]
+        offset += 8
+        self.Name = bytes(data[offset:offset + NameLength]).split(b'\x00', 1)[0].decode("cp932")
+        offset += NameLength
+        
+        (self.MipmapsCount, self.AlphaFlag, self.OneBitAlphaFlag,
+         self.Width, self.Height, Format) = struct.unpack_from(order + "6I", data, offset)
+        self.Format = TextureFormats(Format)
+        offset += 24
+        
+        self.MipmapRanges = []
+        for i in range(self.MipmapsCount):
+            mipmapSize = struct.unpack_from(order + "I", data, offset)[0]
+            self.MipmapRanges.append((offset + 4, mipmapSize))
+            offset += 4 + mipmapSize
+        
+        self.Source = data
+        self.Mipmaps = None
+        self.RecordRange = (start, offset)
+        return offset
+    
     def __br_write__(self, br: BinaryReader):
         br.write_uint32(0)
         br.write_uint32(len(self.Name))
@@ -88,19 +241,30 @@ class dicTexture(BrStruct):
         br.write_uint32(self.Format.value)
         for mipmap in self.Mipmaps:
             br.write_uint32(len(mipmap))
-            br.write_bytes(mipmap)
+            br.write_bytes(bytes(mipmap))
 
 
-class dipFile(BrStruct):
+class dipFile(texDictionary):
     def __init__(self):
-        self.TexturesCount = 0
-        self.Textures = []
+        super().__init__()
+        self.Endian = Endian.LITTLE
     
     def __br_read__(self, br: BinaryReader):
         br.seek(4, 1)
         self.TexturesCount = br.read_uint32()
 
         self.Textures = br.read_struct(dicTexture, self.TexturesCount)
+    
+    def scan(self, data):
+        #lazy counterpart of __br_read__ for a memoryview of the whole file
+        self.TexturesCount = struct.unpack_from("<I", data, 4)[0]
+        
+        offset = 8
+        self.Textures = []
+        for i in range(self.TexturesCount):
+            texture = dicTexture()
+            offset = texture.scan(data, offset, Endian.LITTLE)
+            self.Textures.append(texture)
 
     def __br_write__(self, br: BinaryReader):
         br.write_uint32(0)
@@ -128,7 +292,10 @@ BitCount = {
 }
 
 
-def dic2dds(dic: dicTexture):
+def dic2dds(dic: dicTexture, mip=0):
+    #mip drops the levels above it, the dds starts at that level's size
+    width, height = mip_size(dic, mip)
+    
     dds = DDS()
     dds.magic = 'DDS '
     header = dds.header = DDS_Header()
@@ -137,13 +304,13 @@ def dic2dds(dic: dicTexture):
     # DDSD_CAPS | DDSD_HEIGHT | DDSD_WIDTH | DDSD_PIXELFORMAT
     header.flags = 0x1 | 0x2 | 0x4 | 0x1000
 
-    header.width = dic.Width
-    header.height = dic.Height
-    header.mipMapCount = dic.MipmapsCount
+    header.width = width
+    header.height = height
+    header.mipMapCount = dic.MipmapsCount - mip
 
     # check dic format
     header.flags |= 0x8  # DDSD_PITCH
-    header.pitchOrLinearSize = dic.Width * BitCount[dic.Format]
+    header.pitchOrLinearSize = width * BitCount[dic.Format]
     header.pixel_format.fourCC = None
     header.pixel_format.rgbBitCount = BitCount[dic.Format]
     header.pixel_format.bitmasks = BitMasks[dic.Format]
@@ -151,9 +318,10 @@ def dic2dds(dic: dicTexture):
     if dic.AlphaFlag:
         header.pixel_format.flags |= 0x01 #DDPF_ALPHAPIXELS
     
-    dds.mipmaps = dic.Mipmaps
+    #mipmaps can be views of shared memory, the dds writer needs real bytes
+    dds.mipmaps = [bytes(mipmap) for mipmap in dic.Mipmaps[mip:]]
 
-    dds.texture_data = dic.Data
+    dds.texture_data = dds.mipmaps[0]
 
     header.pixel_format.size = 32
     if header.mipMapCount > 1:
@@ -198,9 +366,10 @@ def dic2ddso(dic: dicTexture):
     if dic.OneBitAlphaFlag:
         header.pixel_format.flags |= 0x02 #DDPF_ALPHA
     
-    dds.mipmaps = dic.Mipmaps
+    #mipmaps can be views of shared memory, the dds writer needs real bytes
+    dds.mipmaps = [bytes(mipmap) for mipmap in dic.Mipmaps]
 
-    dds.texture_data = dic.Data
+    dds.texture_data = bytes(dic.Data)
 
     header.pixel_format.size = 32
     if header.mipMapCount > 1:
@@ -219,21 +388,78 @@ def dic2ddso(dic: dicTexture):
     return dds
 
 
+def mip_size(dic: dicTexture, mip=0):
+    return max(dic.Width >> mip, 1), max(dic.Height >> mip, 1)
+
+
+def select_mip(dic: dicTexture, level=0, min_resolution=0):
+    #with min_resolution, the smallest level whose larger side is still at least that big
+    #otherwise level itself, both limited to the levels the texture has
+    last = max(dic.MipmapsCount - 1, 0)
+    if min_resolution > 0:
+        mip = 0
+        while mip < last and max(mip_size(dic, mip + 1)) >= min_resolution:
+            mip += 1
+        return mip
+    
+    return min(max(level, 0), last)
+
+
+def dic2rgba(dic: dicTexture, mip=0):
+    #float RGBA of a mip level with the rows flipped to start at the bottom, ready for image.pixels.foreach_set
+    width, height = mip_size(dic, mip)
+    rgba = decode_pixels_float(dic.get_mipmap(mip), width, height, dic.Format, dic.AlphaFlag)
+    return rgba[::-1].ravel()
+
+
+def convert_texture(dic: dicTexture, mode="PIXELS", cache=None, mip=0):
+    #PIXELS gives the flat float RGBA of dic2rgba, DDS gives the bytes of a DDS file
+    #with a TextureCache the result is looked up first and stored after converting
+    key = None
+    if cache and dic.DictionaryHash:
+        key = cache.key(dic.DictionaryHash, dic.Name, mode, mip)
+        data = cache.get(key, mode)
+        if data is not None:
+            return data
+    
+    if mode == "DDS":
+        data = bytes(dic2dds(dic, mip))
+    else:
+        data = dic2rgba(dic, mip)
+    
+    #pixels are cached as the final float array so a hit goes straight to foreach_set without converting
+    if key:
+        cache.put(key, mode, data)
+    return data
+
+
+def convert_textures(textures, mode="PIXELS", max_workers=None, cache=None, mips=None):
+    #converts textures (from one or several dictionaries) in a thread pool and yields them in order
+    #numpy releases the GIL for most of the work, only a few results are kept ahead to bound memory use
+    #mips optionally gives the mip level to convert for each texture
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if mips is None:
+        mips = [0] * len(textures)
+    
+    with ThreadPoolExecutor(max_workers) as executor:
+        window = max_workers * 2
+        pending = deque()
+        for texture, mip in zip(textures, mips):
+            pending.append(executor.submit(convert_texture, texture, mode, cache, mip))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        
+        while pending:
+            yield pending.popleft().result()
+
+
 def rgb565_to_rgb888(data, order = "BGR"):
-    pixels = []
-    if order == "BGR":
-        for i in range(0, len(data), 2):
-            b = data[i] & 0x1f
-            g = ((data[i] & 0xe0) >> 5) | ((data[i + 1] & 0x07) << 3)
-            r = (data[i + 1] & 0xf8) >> 3
-            pixels.append((r, g, b))
-    elif order == "RGB":
-        for i in range(0, len(data), 2):
-            r = data[i] & 0x1f
-            g = ((data[i] & 0xe0) >> 5) | ((data[i + 1] & 0x07) << 3)
-            b = (data[i + 1] & 0xf8) >> 3
-            pixels.append((r, g, b))
-    return pixels
+    #BGR is the usual layout with red in the high bits, RGB has red and blue swapped
+    rgb = decode_pixels(data, len(data) // 2, 1, TextureFormats.R5G6B5)[0, :, :3]
+    if order == "RGB":
+        rgb = rgb[:, ::-1]
+    return [tuple(pixel) for pixel in rgb.tolist()]
 
 
 def dic2dds_file(dic: dicTexture, filepath):
@@ -251,7 +477,8 @@ def dic2dds_file(dic: dicTexture, filepath):
         f.write(dds)
 
 
-def dds2dic(file_path):
+def dds2dic(file_path, generate_mipmaps=False, mip_filter="BOX"):
+    #with generate_mipmaps a dds with a single level gets a full mip chain built from it
     #read dds
     with open(file_path, 'rb') as f:
         br = BinaryReader(f.read(), Endian.LITTLE, "cp932")
@@ -287,14 +514,18 @@ def dds2dic(file_path):
         
     dicTex.Width = dds_header.width
     dicTex.Height = dds_header.height
-    dicTex.MipmapsCount = dds_header.mipMapCount
 
     #check for mipmaps
     if dds_header.mipMapCount > 1:
         dicTex.Mipmaps = dds.mipmaps
+    elif generate_mipmaps:
+        rgba = decode_pixels(dds.texture_data, dicTex.Width, dicTex.Height, dicTex.Format, dicTex.AlphaFlag)
+        dicTex.Mipmaps = [dds.texture_data] + build_mip_chain(rgba, dicTex.Format, dicTex.AlphaFlag, mip_filter)
     else:
         dicTex.Mipmaps = [dds.texture_data]
 
+    #dds files without mipmaps can have a count of 0
+    dicTex.MipmapsCount = len(dicTex.Mipmaps)
     dicTex.Data = dicTex.Mipmaps[0]
 
     return dicTex
@@ -342,57 +573,141 @@ def dump_tex_dict(tex_dict: dicFile, folder):
         input("Press enter to exit...")
 
 
-def repack_tex_dict(folder, dict_format):
+def repack_tex_dict(folder, dict_format, generate_mipmaps=True):
     #check for dds files inside
     
     folder_name = os.path.basename(folder)
     parent_folder = os.path.dirname(folder)
     
     dds_files = []
-    dict_textures = []
     for file in os.listdir(folder):
         if file.endswith(".dds"):
-            dds_files.append(file)
+            dds_files.append(os.path.join(folder, file))
 
     if len(dds_files) > 0:
-        for file in dds_files:
-            print("Converting", file, "to DIC")
-            dict_textures.append(dds2dic(os.path.join(path, file)))
-
-        #create dic file
-        if dict_format == "1":
-            dic = dipFile()
-        else:
-            dic = dicFile()
-        dic.TexturesCount = len(dict_textures)
-        dic.Textures = dict_textures
-
         if dict_format == "1":
             dict_name = f"{folder_name}.dip"
-            #write dip file
-            with open(os.path.join(parent_folder, dict_name), 'wb') as f:
-                br = BinaryReader(endianness=Endian.LITTLE)
-                br.write_struct(dic)
-                f.write(br.buffer())
         else:
             dict_name = f"{folder_name}.dic"
         
-            #write dic file
-            with open(os.path.join(parent_folder, dict_name), 'wb') as f:
-                br = BinaryReader(endianness=Endian.BIG)
-                br.write_struct(dic)
-                f.write(br.buffer())
+        write_tex_dict(dds_files, os.path.join(parent_folder, dict_name), dict_format == "1", generate_mipmaps=generate_mipmaps)
     
         input("Press enter to exit...")
     else:
         print("No dds files found")
         input("Press enter to exit...")
 
+
+def dds2dic_record(file_path, endian=Endian.BIG, generate_mipmaps=True):
+    #the serialized dicTexture record of a dds file, runs in a worker when repacking
+    print("Converting", os.path.basename(file_path), "to DIC")
+    br = BinaryReader(endianness=endian, encoding="cp932")
+    br.write_struct(dds2dic(file_path, generate_mipmaps))
+    return bytes(br.buffer())
+
+
+def write_tex_dict_header(f, count, dip, endian=None):
+    if endian is None:
+        endian = Endian.LITTLE if dip else Endian.BIG
+    br = BinaryReader(endianness=endian)
+    if dip:
+        br.write_uint32(0)
+    br.write_uint32(count)
+    f.write(br.buffer())
+
+
+def write_tex_dict(dds_paths, output_path, dip=False, max_workers=None, generate_mipmaps=True):
+    #encodes the dds files in a pool of processes and streams the records to output_path in order
+    #only a few encoded records are held at a time, files that fail to convert are left out and the count is fixed at the end
+    from ..ParallelZWO import create_process_pool
+    
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    endian = Endian.LITTLE if dip else Endian.BIG
+    
+    written = []
+    def write(dds_path, future):
+        try:
+            f.write(future.result())
+            written.append(dds_path)
+        except Exception as e:
+            print(f"Error converting {dds_path}: {e}")
+    
+    with open(output_path, 'wb') as f, create_process_pool(min(max_workers, max(len(dds_paths), 1))) as executor:
+        write_tex_dict_header(f, len(dds_paths), dip)
+        
+        window = max_workers * 2
+        pending = deque()
+        for dds_path in dds_paths:
+            pending.append((dds_path, executor.submit(dds2dic_record, dds_path, endian, generate_mipmaps)))
+            if len(pending) >= window:
+                write(*pending.popleft())
+        
+        while pending:
+            write(*pending.popleft())
+        
+        if len(written) != len(dds_paths):
+            f.seek(0)
+            write_tex_dict_header(f, len(written), dip)
+    
+    return len(written)
+
+
+def patch_tex_dict(dict_path, dds_paths, output_path=None, generate_mipmaps=True):
+    #replaces the textures of the dictionary at dict_path that have a dds in dds_paths and appends the new ones,
+    #textures are matched by name like repack_tex_dict names them
+    #unchanged records are copied byte for byte from the source and only the dds files are encoded
+    #the output is streamed to a temporary file and moved over output_path, which defaults to dict_path
+    output_path = output_path or dict_path
+    dic = read_tex_dictionary(dict_path, lazy=True)
+    if dic is None:
+        return None
+    
+    replacements = {os.path.basename(dds_path).split(".")[0]: dds_path for dds_path in dds_paths}
+    names = {texture.Name for texture in dic.Textures}
+    added = [name for name in replacements if name not in names]
+    endian = dic.Endian
+    
+    temp_path = f"{output_path}.tmp"
+    try:
+        with open(temp_path, 'wb') as f:
+            write_tex_dict_header(f, dic.TexturesCount + len(added), isinstance(dic, dipFile), endian)
+            
+            for texture in dic.Textures:
+                if texture.Name in replacements:
+                    f.write(dds2dic_record(replacements[texture.Name], endian, generate_mipmaps))
+                else:
+                    start, end = texture.RecordRange
+                    f.write(texture.Source[start:end])
+            
+            for name in added:
+                f.write(dds2dic_record(replacements[name], endian, generate_mipmaps))
+        
+        #the source has to be unmapped before it can be replaced
+        dic.close()
+        os.replace(temp_path, output_path)
+    finally:
+        dic.close()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    
+    return output_path
+
+
 if __name__ == "__main__":
     if len(sys.argv) > 1:
         
         path = sys.argv[1]
-        if os.path.isfile(path):
+        #patch mode
+        #a dictionary followed by dds files replaces or adds just those textures
+        if os.path.isfile(path) and len(sys.argv) > 2:
+            try:
+                print("Patched", patch_tex_dict(path, [file for file in sys.argv[2:] if file.endswith(".dds")]))
+            except Exception as e:
+                print(e)
+            input("Press enter to exit...")
+        
+        elif os.path.isfile(path):
             #read dic file
             dic = read_tex_dictionary(path)
             if dic:
@@ -10,13 +10,26 @@ from .zwoAnimation import zwoAnimation
 from .zwoNode import zwoNode
 import cProfile
 
+#entities without a size prefix, they are always read while scanning
+InlineEntities = {
+    zwoTypes.Camera: zwoCamera,
+    zwoTypes.SkeletalAnimation: zwoSkeletalAnimation,
+    zwoTypes.Node: zwoNode,
+    zwoTypes.Animation: zwoAnimation,
+}
+
 class zwoFile(BrStruct):
     def __init__(self):
         self.Entities = []
+        self.Arena = None
+        self.Source = None
     
-    def __br_read__(self, br: BinaryReader):
+    def __br_read__(self, br: BinaryReader, lazy=False):
             while not br.eof():
                 EntityType = zwoTypes(br.read_uint32())
+                #every entity remembers where its struct starts so it can be read again on its own
+                offset = br.pos()
+                count = len(self.Entities)
                 if EntityType == zwoTypes.EOF:
                      break
                 elif EntityType == zwoTypes.Camera:
@@ -28,7 +41,7 @@ class zwoFile(BrStruct):
                 elif EntityType == zwoTypes.Mesh:
                     pos = br.pos()
                     try:
-                        self.Entities.append(br.read_struct(zwoMesh))
+                        self.Entities.append(br.read_struct(zwoMesh, None, lazy))
                     except:
                         print(f"Error reading mesh at {pos}")
                         br.seek(pos, 0)
@@ -62,6 +75,39 @@ class zwoFile(BrStruct):
                 elif EntityType == zwoTypes.OmniLight:
                     #self.Entities.append(br.read_struct(zwoOmniLight))
                     br.read_bytes(br.peek_uint32())
+                
+                if len(self.Entities) > count:
+                    self.Entities[-1].Offset = offset
+    
+    def scan(self, br: BinaryReader):
+        #first phase of the two phase reader, entities with a size prefix are only located as (type, offset, size)
+        #the ones without a size have to be read in place to find where the next entity starts
+        slots = []
+        while not br.eof():
+            EntityType = zwoTypes(br.read_uint32())
+            if EntityType == zwoTypes.EOF:
+                break
+            
+            offset = br.pos()
+            if EntityType in (zwoTypes.Material, zwoTypes.Mesh, zwoTypes.Skeleton):
+                size = br.peek_uint32()
+                slots.append((EntityType, offset, size))
+                br.seek(size, Whence.CUR)
+            
+            elif EntityType in (zwoTypes.CameraAnimation, zwoTypes.Light, zwoTypes.LightAmbientBox, zwoTypes.OmniLight):
+                br.read_bytes(br.peek_uint32())
+            
+            else:
+                entity = br.read_struct(InlineEntities[EntityType])
+                entity.Offset = offset
+                slots.append(entity)
+        
+        return slots
+    
+    def decode_meshes(self, meshes):
+        #decodes the buffers of lazily read meshes from the source bytes kept by read_zwo
+        for mesh in meshes:
+            mesh.decode(self.Source)
     
 
     def __br_write__(self, br: BinaryReader):
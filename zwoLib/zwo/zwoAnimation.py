@@ -2,6 +2,8 @@ from ..utils.PyBinaryReader.binary_reader import *
 from .zwoEntity import zwoEntity
 from .zwoHelpers import zwoVector, zwoQuaternion
 from .zwoTypes import zwoTypes
+import numpy as np
+
 class zwoAnimation(BrStruct):
     def __init__(self):
         self.Type = zwoTypes.Animation
@@ -35,9 +37,10 @@ class zwoAnimation(BrStruct):
         
         br.set_endian(Endian.LITTLE) #Animation data is little endian
 
-        self.Positions = [zwoVector(br) for i in range(self.FrameCount)]
-        self.Rotations = [zwoQuaternion(br) for i in range(self.FrameCount)]
-        self.Scales = [zwoVector(br) for i in range(self.FrameCount)]
+        #read the tracks as arrays instead of one tuple per frame
+        self.Positions = np.frombuffer(br.read_bytes(self.FrameCount * 12), dtype="<f4").reshape(self.FrameCount, 3)
+        self.Rotations = np.frombuffer(br.read_bytes(self.FrameCount * 16), dtype="<f4").reshape(self.FrameCount, 4)
+        self.Scales = np.frombuffer(br.read_bytes(self.FrameCount * 12), dtype="<f4").reshape(self.FrameCount, 3)
 
         br.set_endian(Endian.BIG) #Back to big endian
 
@@ -0,0 +1,136 @@
+from .zwoTypes import zwoTypes
+import numpy as np
+
+#zwoVertexArena packs the vertex and face data of every mesh in a file into a few large native arrays
+#each mesh owns a range of rows described by the offset and count tables, so whole-file operations
+#(bounds, transforms, merging) run as single numpy passes instead of one pass per mesh
+class zwoVertexArena:
+    def __init__(self, meshes=()):
+        self.Meshes = []
+        self.Names = []
+        self.VertexOffsets = np.zeros(0, dtype=np.int64)
+        self.VertexCounts = np.zeros(0, dtype=np.int64)
+        self.FaceOffsets = np.zeros(0, dtype=np.int64)
+        self.FaceCounts = np.zeros(0, dtype=np.int64)
+        self.Attributes = {}
+        self.HasAttribute = {}
+        self.Faces = np.zeros((0, 3), dtype=np.int32)
+        self.MaterialIndices = np.zeros(0, dtype=np.int32)
+
+        if meshes:
+            self.build(meshes)
+
+    def build(self, meshes):
+        #only the first vertex buffer of meshes with geometry goes in the arena
+        self.Meshes = [mesh for mesh in meshes if mesh.VertexBuffers]
+        self.Names = [mesh.Entity.Name for mesh in self.Meshes]
+
+        vertex_buffers = [mesh.VertexBuffers[0].Vertices for mesh in self.Meshes]
+        face_buffers = [mesh.FaceBuffer.Faces for mesh in self.Meshes]
+
+        self.VertexCounts = np.array([len(v) for v in vertex_buffers], dtype=np.int64)
+        self.FaceCounts = np.array([len(f) for f in face_buffers], dtype=np.int64)
+        self.VertexOffsets = np.cumsum(self.VertexCounts) - self.VertexCounts
+        self.FaceOffsets = np.cumsum(self.FaceCounts) - self.FaceCounts
+
+        vertex_total = int(self.VertexCounts.sum())
+        face_total = int(self.FaceCounts.sum())
+
+        #allocate one array per attribute found in any mesh, meshes without it keep zeros
+        for vertices in vertex_buffers:
+            for name in vertices.dtype.names:
+                if name in self.Attributes:
+                    continue
+                field = vertices.dtype[name]
+                if field.base.kind == 'f':
+                    native_type = np.float32
+                elif field.base.itemsize == 1:
+                    native_type = np.uint8
+                else:
+                    native_type = np.int32
+                self.Attributes[name] = np.zeros((vertex_total,) + field.shape, dtype=native_type)
+                self.HasAttribute[name] = np.zeros(len(self.Meshes), dtype=bool)
+
+        self.Faces = np.empty((face_total, 3), dtype=np.int32)
+        self.MaterialIndices = np.empty(face_total, dtype=np.int32)
+
+        for i, mesh in enumerate(self.Meshes):
+            vertices = vertex_buffers[i]
+            start = self.VertexOffsets[i]
+            end = start + self.VertexCounts[i]
+
+            native = {}
+            for name in vertices.dtype.names:
+                #the assignment converts from big endian in the same copy
+                self.Attributes[name][start:end] = vertices[name]
+                self.HasAttribute[name][i] = True
+                native[name] = self.Attributes[name][start:end]
+
+            #the mesh's native arrays become views into the arena
+            mesh.VertexBuffers[0].NativeVertices = native
+
+            faces = face_buffers[i]
+            face_start = self.FaceOffsets[i]
+            face_end = face_start + self.FaceCounts[i]
+            self.Faces[face_start:face_end] = faces["indices"]
+            self.MaterialIndices[face_start:face_end] = faces["materialIndex"]
+
+    def vertex_range(self, index):
+        start = int(self.VertexOffsets[index])
+        return slice(start, start + int(self.VertexCounts[index]))
+
+    def face_range(self, index):
+        start = int(self.FaceOffsets[index])
+        return slice(start, start + int(self.FaceCounts[index]))
+
+    def vertex_mesh_ids(self):
+        return np.repeat(np.arange(len(self.Meshes)), self.VertexCounts)
+
+    def face_mesh_ids(self):
+        return np.repeat(np.arange(len(self.Meshes)), self.FaceCounts)
+
+    def global_faces(self):
+        #face indices rebased so they index the arena's vertex arrays directly
+        return self.Faces + np.repeat(self.VertexOffsets, self.FaceCounts).astype(np.int32)[:, None]
+
+    def bounds(self):
+        #per mesh axis aligned bounds of the untransformed positions, empty meshes get nan
+        mins = np.full((len(self.Meshes), 3), np.nan, dtype=np.float32)
+        maxs = np.full((len(self.Meshes), 3), np.nan, dtype=np.float32)
+        filled = self.VertexCounts > 0
+        if filled.any():
+            positions = self.Attributes["position"]
+            offsets = self.VertexOffsets[filled]
+            mins[filled] = np.minimum.reduceat(positions, offsets, axis=0)
+            maxs[filled] = np.maximum.reduceat(positions, offsets, axis=0)
+        return mins, maxs
+
+    def world_matrices(self):
+        #world @ local of the first transformer, the same transform the importer applies to rigid meshes
+        matrices = np.empty((len(self.Meshes), 4, 4), dtype=np.float32)
+        for i, mesh in enumerate(self.Meshes):
+            geometry = mesh.Geometry
+            local = np.array(geometry.LocalTransformers[0].Matrix, dtype=np.float32)
+            world = np.array(geometry.WorldTransformers[0].Matrix, dtype=np.float32)
+            matrices[i] = world @ local
+        return matrices
+
+    def transformed_positions(self, matrices):
+        mesh_ids = self.vertex_mesh_ids()
+        positions = self.Attributes["position"]
+        rotations = matrices[:, :3, :3][mesh_ids]
+        translations = matrices[:, :3, 3][mesh_ids]
+        return np.einsum('nij,nj->ni', rotations, positions) + translations
+
+    def transformed_normals(self, matrices):
+        #normals use the inverse transpose of each mesh's linear part
+        mesh_ids = self.vertex_mesh_ids()
+        normal_matrices = np.linalg.pinv(matrices[:, :3, :3]).transpose(0, 2, 1)
+        normals = np.einsum('nij,nj->ni', normal_matrices[mesh_ids], self.Attributes["normal"])
+        lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+        np.divide(normals, lengths, out=normals, where=lengths > 0)
+        return normals.astype(np.float32)
+
+
+def build_arena(zwo):
+    return zwoVertexArena([entity for entity in zwo.Entities if entity.Type == zwoTypes.Mesh])
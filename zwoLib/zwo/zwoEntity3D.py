@@ -14,6 +14,7 @@ class zwoEntity3D(BrStruct):
         self.Param2 = None
         self.unk2 = 0
         self.MeshType = 0
+        self.InstancedObjectName = ""
         self.WorldTransformer = None
         self.unk5 = 0
     def __br_read__(self, br: BinaryReader):
@@ -85,9 +86,9 @@ class zwoEntity3D(BrStruct):
             br.write_uint32(self.MeshType)
             
         if (self.flags1 & 2) != 0:
-            br.write_uint32(len(self.Param1))
-            br.write_str(self.Param1)
-            br.write_struct(self.Transformer1)
+            br.write_uint32(len(self.InstancedObjectName))
+            br.write_str(self.InstancedObjectName)
+            br.write_struct(self.WorldTransformer)
             
         if (self.flags1 & 0x20) != 0:
             br.write_uint32(self.unk5)
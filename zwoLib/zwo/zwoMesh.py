@@ -4,6 +4,7 @@ from .zwoEntity import zwoEntity
 from .zwoEntity3D import zwoEntity3D
 from .zwoHelpers import zwoVector, zwoQuaternion, zwoMatrix, zwoOBB
 import json
+import hashlib
 import numpy as np
 class zwoMesh(BrStruct):
     def __init__(self):
@@ -17,8 +18,10 @@ class zwoMesh(BrStruct):
         self.Data = None
         self.VertexBufferFlag = 0
         self.isInstance = False
+        self.isDecoded = True
+        self.GeometryHash = None
         
-    def __br_read__(self, br:BinaryReader):
+    def __br_read__(self, br:BinaryReader, lazy=False):
         self.Entity: zwoEntity = br.read_struct(zwoEntity)
         
         self.Name = self.Entity.Name
@@ -41,9 +44,15 @@ class zwoMesh(BrStruct):
             else:
                 VertexBufferCount = 1
 
-            self.VertexBuffers = br.read_struct(VertexBuffer, VertexBufferCount)
+            #lazy meshes only record where their buffers are, decode() reads them later
+            self.VertexBuffers = br.read_struct(VertexBuffer, VertexBufferCount, lazy)
+            
+            self.FaceBuffer = br.read_struct(FaceBuffer, None, lazy)
             
-            self.FaceBuffer = br.read_struct(FaceBuffer)
+            if lazy:
+                self.isDecoded = False
+            else:
+                self.hash_geometry()
         
         if self.Entity3D.HasAnimFrame:
             self.AnimFrame = br.read_uint32()
@@ -51,6 +60,28 @@ class zwoMesh(BrStruct):
         if self.Entity3D.HasInstance:
             self.isInstance = True
     
+    def hash_geometry(self):
+        #hash the raw geometry so identical meshes can be detected without comparing their arrays
+        geometry_hash = hashlib.blake2b(digest_size=16)
+        for vertex_buffer in self.VertexBuffers:
+            geometry_hash.update(vertex_buffer.VertexFlags.to_bytes(4, 'big'))
+            geometry_hash.update(vertex_buffer.Vertices.view(np.uint8))
+        geometry_hash.update(self.FaceBuffer.IndexType.to_bytes(4, 'big'))
+        geometry_hash.update(self.FaceBuffer.Faces.view(np.uint8))
+        self.GeometryHash = geometry_hash.hexdigest()
+    
+    def decode(self, data):
+        #reads the vertex and face buffers of a lazily parsed mesh from the file's bytes
+        if self.isDecoded:
+            return
+        
+        for vertex_buffer in self.VertexBuffers:
+            vertex_buffer.decode(data)
+        self.FaceBuffer.decode(data)
+        
+        self.isDecoded = True
+        self.hash_geometry()
+    
     def __br_write__(self, br:BinaryReader):
         
         mesh_buf = BinaryReader(endianness=Endian.BIG, encoding='cp932')
@@ -73,18 +104,21 @@ class zwoMesh(BrStruct):
             mesh_buf.write_uint32(self.Entity.unk6)
             
         mesh_buf.write_struct(self.Entity3D)
-        mesh_buf.write_struct(self.Geometry)
-        mesh_buf.write_uint32(self.VertexBufferFlag)
-        mesh_buf.write_uint32(self.unk2)
         
-        if self.Entity3D.MeshType == 2:
-            mesh_buf.write_float(self.unk3)
-            mesh_buf.write_float(self.unk4)
-        
-        for vb in self.VertexBuffers:
-            mesh_buf.write_struct(vb)
+        #instances only reference another mesh, they have no geometry of their own
+        if self.Entity3D.flags1 & 1:
+            mesh_buf.write_struct(self.Geometry)
+            mesh_buf.write_uint32(self.VertexBufferFlag)
+            mesh_buf.write_uint32(self.unk2)
+            
+            if self.Entity3D.MeshType == 2:
+                mesh_buf.write_float(self.unk3)
+                mesh_buf.write_float(self.unk4)
+            
+            for vb in self.VertexBuffers:
+                mesh_buf.write_struct(vb)
 
-        mesh_buf.write_struct(self.FaceBuffer)
+            mesh_buf.write_struct(self.FaceBuffer)
         
         mesh_size = mesh_buf.size()
         br.write_uint32(mesh_size + 4)
@@ -149,6 +183,9 @@ class VertexBuffer(BrStruct):
         self.VertexCount = 0
         self.VertexFlags = 0
         self.Vertices = []
+        self.NativeVertices = None
+        self.VertexDtype = None
+        self.DataOffset = 0
 
         self.PosPerVertex = 1
         self.NormPerVertex = 0
@@ -156,7 +193,7 @@ class VertexBuffer(BrStruct):
         self.UVPerVertex = 0
         self.WeightPerVertex = 0
 
-    def __br_read__(self, br:BinaryReader):
+    def __br_read__(self, br:BinaryReader, lazy=False):
         #start = perf_counter()
         self.VertexCount = br.read_uint32()
         self.VertexFlags = br.read_uint32()
@@ -216,14 +253,42 @@ class VertexBuffer(BrStruct):
         
 
             
-        vertex_dtype = np.dtype(vertexDtypeList)
-        self.Vertices = np.frombuffer(br.read_bytes(self.VertexCount * vertexSize), dtype=vertex_dtype)
+        self.VertexDtype = np.dtype(vertexDtypeList)
+        
+        if lazy:
+            self.DataOffset = br.pos()
+            br.seek(self.VertexCount * vertexSize, Whence.CUR)
+        else:
+            self.Vertices = np.frombuffer(br.read_bytes(self.VertexCount * vertexSize), dtype=self.VertexDtype)
         
 
         
         #print(f"Vertex Buffer read in {perf_counter() - start} seconds")
     
     
+    def decode(self, data):
+        self.Vertices = np.frombuffer(data, dtype=self.VertexDtype, count=self.VertexCount, offset=self.DataOffset)
+    
+    
+    def to_native(self):
+        #converts the big endian interleaved vertices once into contiguous native arrays, one per attribute
+        #floats become float32, colors uint8 and bone indices int32
+        if self.NativeVertices is None:
+            self.NativeVertices = {}
+            for name in self.Vertices.dtype.names:
+                field = self.Vertices[name]
+                if field.dtype.kind == 'f':
+                    native_type = np.float32
+                elif field.dtype.itemsize == 1:
+                    native_type = np.uint8
+                else:
+                    native_type = np.int32
+                
+                self.NativeVertices[name] = np.ascontiguousarray(field, dtype=native_type)
+        
+        return self.NativeVertices
+    
+    
     def __br_write__(self, br:BinaryReader):
         br.write_uint32(len(self.Vertices))
         br.write_uint32(self.VertexFlags)
@@ -261,16 +326,27 @@ class FaceBuffer(BrStruct):
         self.IndexType = 0
 
         self.Faces = []
+        self.FaceDtype = None
+        self.DataOffset = 0
     
-    def __br_read__(self, br:BinaryReader):
+    def __br_read__(self, br:BinaryReader, lazy=False):
         self.FaceCount = br.read_uint32()
         self.TrianglesType = br.read_uint32()
         self.IndexType = br.read_uint32()
         
         if self.IndexType == 1:
-            self.Faces = np.frombuffer(br.read_bytes(self.FaceCount * 16), dtype=[("indices", ">3u4"), ("materialIndex", ">u4")])
+            self.FaceDtype = np.dtype([("indices", ">3u4"), ("materialIndex", ">u4")])
         else:
-            self.Faces = np.frombuffer(br.read_bytes(self.FaceCount * 8), dtype=[("indices", ">3u2"), ("materialIndex", ">u2")])
+            self.FaceDtype = np.dtype([("indices", ">3u2"), ("materialIndex", ">u2")])
+        
+        if lazy:
+            self.DataOffset = br.pos()
+            br.seek(self.FaceCount * self.FaceDtype.itemsize, Whence.CUR)
+        else:
+            self.Faces = np.frombuffer(br.read_bytes(self.FaceCount * self.FaceDtype.itemsize), dtype=self.FaceDtype)
+    
+    def decode(self, data):
+        self.Faces = np.frombuffer(data, dtype=self.FaceDtype, count=self.FaceCount, offset=self.DataOffset)
             
 
     
@@ -0,0 +1,279 @@
+from .zwoTypes import zwoTypes
+import numpy as np
+
+#zwoSpatialIndex is a bounding volume hierarchy over the oriented bounding boxes of a file's meshes
+#it only needs the zwoOBB and transformer data, so it answers spatial queries without touching vertex buffers
+#every mesh contributes one box per transformer, instances reuse the boxes of their target moved by their own world matrix
+class zwoSpatialIndex:
+    LeafSize = 8
+
+    def __init__(self, meshes=(), obb_space='WORLD'):
+        self.Entities = []
+        self.TransformerIndices = []
+        self.Centers = np.zeros((0, 3), dtype=np.float64)
+        self.Axes = np.zeros((0, 3, 3), dtype=np.float64)
+        self.Mins = np.zeros((0, 3), dtype=np.float64)
+        self.Maxs = np.zeros((0, 3), dtype=np.float64)
+
+        #flat bvh nodes, leaves have -1 children and own the range start:start+count of Order
+        self.Order = np.zeros(0, dtype=np.int64)
+        self.NodeMins = np.zeros((0, 3), dtype=np.float64)
+        self.NodeMaxs = np.zeros((0, 3), dtype=np.float64)
+        self.NodeLeft = np.zeros(0, dtype=np.int64)
+        self.NodeRight = np.zeros(0, dtype=np.int64)
+        self.NodeStart = np.zeros(0, dtype=np.int64)
+        self.NodeCount = np.zeros(0, dtype=np.int64)
+
+        if meshes:
+            self.build(meshes, obb_space)
+
+    def build(self, meshes, obb_space='WORLD'):
+        #obb_space tells whether the boxes are stored in world space (as the exporter writes them)
+        #or in the mesh's local space, in which case they are moved by world @ local
+        centers = []
+        axes = []
+        entities = []
+        transformer_indices = []
+        mesh_boxes = {}
+
+        for mesh in meshes:
+            if not mesh.Entity3D.HasGeometry:
+                continue
+
+            geometry = mesh.Geometry
+            boxes = []
+            for i, obb in enumerate(geometry.OrientedBoundingBoxes):
+                center = np.array(obb.Center, dtype=np.float64)
+                box_axes = np.array((obb.Axis1, obb.Axis2, obb.Axis3), dtype=np.float64)
+
+                if obb_space == 'LOCAL':
+                    matrix = (np.array(geometry.WorldTransformers[i].Matrix, dtype=np.float64)
+                              @ np.array(geometry.LocalTransformers[i].Matrix, dtype=np.float64))
+                    center = matrix[:3, :3] @ center + matrix[:3, 3]
+                    box_axes = box_axes @ matrix[:3, :3].T
+
+                boxes.append((center, box_axes))
+                centers.append(center)
+                axes.append(box_axes)
+                entities.append(mesh)
+                transformer_indices.append(i)
+
+            mesh_boxes[mesh.Entity.Name] = (mesh, boxes)
+
+        for mesh in meshes:
+            if not mesh.isInstance or mesh.Entity3D.WorldTransformer is None:
+                continue
+
+            target = mesh_boxes.get(mesh.Entity3D.InstancedObjectName)
+            if not target:
+                continue
+
+            #move the target's boxes from the target's world matrix to the instance's
+            target_mesh, boxes = target
+            if not boxes:
+                continue
+            target_world = np.array(target_mesh.Geometry.WorldTransformers[0].Matrix, dtype=np.float64)
+            instance_world = np.array(mesh.Entity3D.WorldTransformer.Matrix, dtype=np.float64)
+            matrix = instance_world @ np.linalg.pinv(target_world)
+
+            for i, (center, box_axes) in enumerate(boxes):
+                centers.append(matrix[:3, :3] @ center + matrix[:3, 3])
+                axes.append(box_axes @ matrix[:3, :3].T)
+                entities.append(mesh)
+                transformer_indices.append(i)
+
+        self.Entities = entities
+        self.TransformerIndices = transformer_indices
+
+        if not entities:
+            return
+
+        self.Centers = np.array(centers, dtype=np.float64)
+        self.Axes = np.array(axes, dtype=np.float64)
+        extents = np.abs(self.Axes).sum(axis=1)
+        self.Mins = self.Centers - extents
+        self.Maxs = self.Centers + extents
+
+        self.build_tree()
+
+    def build_tree(self):
+        count = len(self.Entities)
+        self.Order = np.arange(count, dtype=np.int64)
+        node_mins, node_maxs, lefts, rights, starts, counts = [], [], [], [], [], []
+
+        def add_node(start, end):
+            indices = self.Order[start:end]
+            node = len(starts)
+            node_mins.append(self.Mins[indices].min(axis=0))
+            node_maxs.append(self.Maxs[indices].max(axis=0))
+            lefts.append(-1)
+            rights.append(-1)
+            starts.append(start)
+            counts.append(end - start)
+            return node
+
+        root = add_node(0, count)
+        stack = [(root, 0, count)]
+        while stack:
+            node, start, end = stack.pop()
+            if end - start <= self.LeafSize:
+                continue
+
+            #split at the median of the box centers along the widest axis
+            indices = self.Order[start:end]
+            centroids = (self.Mins[indices] + self.Maxs[indices]) * 0.5
+            axis = np.argmax(centroids.max(axis=0) - centroids.min(axis=0))
+            middle = (end - start) // 2
+            self.Order[start:end] = indices[np.argpartition(centroids[:, axis], middle)]
+
+            left = add_node(start, start + middle)
+            right = add_node(start + middle, end)
+            lefts[node] = left
+            rights[node] = right
+            stack.append((left, start, start + middle))
+            stack.append((right, start + middle, end))
+
+        self.NodeMins = np.array(node_mins)
+        self.NodeMaxs = np.array(node_maxs)
+        self.NodeLeft = np.array(lefts, dtype=np.int64)
+        self.NodeRight = np.array(rights, dtype=np.int64)
+        self.NodeStart = np.array(starts, dtype=np.int64)
+        self.NodeCount = np.array(counts, dtype=np.int64)
+
+    def candidates(self, node_test):
+        #walks the tree with node_test(min, max) and returns the box indices of every leaf it reaches
+        if not self.Entities:
+            return np.zeros(0, dtype=np.int64)
+
+        found = []
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            if not node_test(self.NodeMins[node], self.NodeMaxs[node]):
+                continue
+            if self.NodeLeft[node] < 0:
+                start = self.NodeStart[node]
+                found.append(self.Order[start:start + self.NodeCount[node]])
+            else:
+                stack.append(self.NodeLeft[node])
+                stack.append(self.NodeRight[node])
+
+        if not found:
+            return np.zeros(0, dtype=np.int64)
+        return np.sort(np.concatenate(found))
+
+    def unit_axes(self, indices):
+        axes = self.Axes[indices]
+        half_lengths = np.linalg.norm(axes, axis=2)
+        units = np.divide(axes, half_lengths[..., None], out=np.zeros_like(axes), where=half_lengths[..., None] > 0)
+        return units, half_lengths
+
+    def entities_of(self, indices):
+        #boxes are per transformer, so a mesh can appear more than once
+        entities = []
+        seen = set()
+        for index in indices:
+            entity = self.Entities[index]
+            if id(entity) not in seen:
+                seen.add(id(entity))
+                entities.append(entity)
+        return entities
+
+    def query_box(self, box_min, box_max):
+        box_min = np.asarray(box_min, dtype=np.float64)
+        box_max = np.asarray(box_max, dtype=np.float64)
+
+        candidates = self.candidates(lambda node_min, node_max: np.all(node_min <= box_max) and np.all(node_max >= box_min))
+        candidates = candidates[np.all(self.Mins[candidates] <= box_max, axis=1) & np.all(self.Maxs[candidates] >= box_min, axis=1)]
+        if not len(candidates):
+            return []
+
+        #separating axis test between each oriented box and the query box
+        units, half_lengths = self.unit_axes(candidates)
+        box_center = (box_min + box_max) * 0.5
+        box_half = (box_max - box_min) * 0.5
+        world_axes = np.broadcast_to(np.eye(3), units.shape)
+
+        cross_axes = np.cross(units[:, :, None, :], world_axes[:, None, :, :]).reshape(len(candidates), 9, 3)
+        test_axes = np.concatenate((units, world_axes, cross_axes), axis=1)
+
+        offsets = self.Centers[candidates] - box_center
+        distance = np.abs(np.einsum('nkj,nj->nk', test_axes, offsets))
+        obb_radius = np.einsum('nki,ni->nk', np.abs(np.einsum('nkj,nij->nki', test_axes, units)), half_lengths)
+        box_radius = np.abs(test_axes) @ box_half
+
+        overlapping = np.all(distance <= obb_radius + box_radius + 1e-6, axis=1)
+        return self.entities_of(candidates[overlapping])
+
+    def query_sphere(self, center, radius):
+        center = np.asarray(center, dtype=np.float64)
+
+        def node_test(node_min, node_max):
+            closest = np.clip(center, node_min, node_max)
+            return np.sum((closest - center) ** 2) <= radius * radius
+
+        candidates = self.candidates(node_test)
+        if not len(candidates):
+            return []
+
+        #closest point of each oriented box to the sphere center
+        units, half_lengths = self.unit_axes(candidates)
+        offsets = center - self.Centers[candidates]
+        local = np.clip(np.einsum('nij,nj->ni', units, offsets), -half_lengths, half_lengths)
+        closest = self.Centers[candidates] + np.einsum('ni,nij->nj', local, units)
+
+        inside = np.sum((closest - center) ** 2, axis=1) <= radius * radius
+        return self.entities_of(candidates[inside])
+
+    def query_ray(self, origin, direction, max_distance=np.inf):
+        #returns (entity, distance) pairs sorted by distance along the ray
+        origin = np.asarray(origin, dtype=np.float64)
+        direction = np.asarray(direction, dtype=np.float64)
+        direction = direction / np.linalg.norm(direction)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            inverse = 1.0 / direction
+
+        def slab_hit(node_min, node_max):
+            with np.errstate(invalid='ignore'):
+                t1 = (node_min - origin) * inverse
+                t2 = (node_max - origin) * inverse
+            t_near = np.nanmax(np.minimum(t1, t2))
+            t_far = np.nanmin(np.maximum(t1, t2))
+            return t_near <= t_far and t_far >= 0 and t_near <= max_distance
+
+        candidates = self.candidates(slab_hit)
+        if not len(candidates):
+            return []
+
+        #slab test in each box's own frame
+        units, half_lengths = self.unit_axes(candidates)
+        local_origin = np.einsum('nij,nj->ni', units, origin - self.Centers[candidates])
+        local_direction = np.einsum('nij,j->ni', units, direction)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t1 = (-half_lengths - local_origin) / local_direction
+            t2 = (half_lengths - local_origin) / local_direction
+
+        #axes parallel to the ray only hit when the origin is inside that slab
+        parallel = np.abs(local_direction) < 1e-12
+        outside = parallel & (np.abs(local_origin) > half_lengths)
+        t_near = np.where(parallel, -np.inf, np.minimum(t1, t2)).max(axis=1)
+        t_far = np.where(parallel, np.inf, np.maximum(t1, t2)).min(axis=1)
+
+        hit = ~outside.any(axis=1) & (t_near <= t_far) & (t_far >= 0) & (t_near <= max_distance)
+        distances = np.maximum(t_near[hit], 0)
+        order = np.argsort(distances, kind='stable')
+
+        hits = []
+        seen = set()
+        for index, distance in zip(candidates[hit][order], distances[order]):
+            entity = self.Entities[index]
+            if id(entity) not in seen:
+                seen.add(id(entity))
+                hits.append((entity, float(distance)))
+        return hits
+
+
+def build_spatial_index(zwo, obb_space='WORLD'):
+    return zwoSpatialIndex([entity for entity in zwo.Entities if entity.Type == zwoTypes.Mesh], obb_space)